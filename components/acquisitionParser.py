@@ -53,6 +53,8 @@ class AcquisitionFileParser:
     def _validate(self):
         if not self.acquisition.is_complete():
             raise ValueError("ACQUISITION section is missing required fields!")
+        if self.acquisition.burst_reduce not in Acquisition.BURST_REDUCE:
+            raise ValueError(f"Invalid burst_reduce '{self.acquisition.burst_reduce}'. Allowed values are mean or median.")
         if len(self.steps) != self.acquisition.num_steps:
             raise ValueError(
                 f"Number of steps read ({len(self.steps)}) does not match declared num_steps ({self.acquisition.num_steps})!"
@@ -60,6 +62,9 @@ class AcquisitionFileParser:
 
 
 class Acquisition:
+    # How the frames of a burst are combined into one image
+    BURST_REDUCE = ("mean", "median")
+
     def __init__(self):
         self.project = None
         self.experiment = None
@@ -68,6 +73,7 @@ class Acquisition:
         self.operator = None
         self.metadata = {}
         self.num_steps = 0
+        self.burst_reduce = "mean"
 
     def parse_line(self, line):
         if ":" in line:
@@ -87,7 +93,7 @@ class Acquisition:
 
 
 class Step:
-    def __init__(self, step, t_int, gain, z_pos, lam, phi_g, phi_a, flt_a):
+    def __init__(self, step, t_int, gain, z_pos, lam, phi_g, phi_a, flt_a, n_frames=1):
         self.step = int(step)
         self.t_int = float(t_int)
         self.gain = float(gain)
@@ -96,10 +102,14 @@ class Step:
         self.phi_g = float(phi_g)
         self.phi_a = float(phi_a)
         self.flt_a = flt_a
+        # Optional column, frames captured per trigger
+        self.n_frames = int(n_frames)
 
         # Validate filter using Enum
         if not FilterEnum.has_value(self.flt_a):
             raise ValueError(f"Invalid filter value '{self.flt_a}'. Allowed values are 1, 2, 3, or 4.")
+        if self.n_frames < 1:
+            raise ValueError(f"Invalid number of frames '{self.n_frames}'. At least one frame is required.")
 
     @classmethod
     def parse_line(cls, line):
@@ -111,5 +121,5 @@ class Step:
         return (
             f"Step(step={self.step}, t_int={self.t_int}, gain={self.gain}, "
             f"z_pos={self.z_pos}, lam={self.lam}, phi_g={self.phi_g}, "
-            f"phi_a={self.phi_a}, flt_a='{self.flt_a}')"
+            f"phi_a={self.phi_a}, flt_a='{self.flt_a}', n_frames={self.n_frames})"
         )
\ No newline at end of file
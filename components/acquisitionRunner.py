@@ -2,14 +2,14 @@ import os
 import zipfile
 import time
 from fs.zipfs import ZipFS  # pyfilesystem2 library
-from components.handler import MsgTypes
+from components.handler import MsgTypes, Topics
 import json
 import h5py
 import numpy as np
 from PIL import Image
 
 class AcquisitionRunner:
-    def __init__(self, acquisition_parser, pwd, system):
+    def __init__(self, acquisition_parser, pwd, system, progress=None):
         self.acquisition_parser = acquisition_parser
         self.pwd = pwd
         self.mounted_fs = None
@@ -17,20 +17,38 @@ class AcquisitionRunner:
         self.frame = None
         self.system = system
         self.idx = 0
+        self.progress = progress
+        # Float copy of the frame, reused for every step
+        self.scratch = None
 
     def image_acquire_callback(self, data):
-        # Ensure the array is in np.float32 format
-        data = data.astype(np.float32)
+        # A burst arrives as a stack of frames
+        frames = data.shape[0] if data.ndim == 3 else 1
+        shape = data.shape[-2:]
+        # Convert to np.float32 in the scratch buffer and return the camera frame
+        if self.scratch is None or self.scratch.shape != shape:
+            self.scratch = np.empty(shape, np.float32)
+        if frames == 1:
+            np.copyto(self.scratch, data.reshape(shape))
+        elif self.acquisition_parser.acquisition.burst_reduce == "median":
+            np.median(data, axis=0, out=self.scratch)
+        else:
+            np.mean(data, axis=0, dtype=np.float32, out=self.scratch)
+        self.system.releaseFrame(data)
+        data = self.scratch
         
         # Save the raw data as HDF5
         raw_filename = f"raw/frame_{self.idx:03d}.h5"
         with self.mounted_fs.open(raw_filename, "wb") as raw_file:
             with h5py.File(raw_file, "w") as hdf:
-                hdf.create_dataset("image", data=data, dtype="float32")
+                dataset = hdf.create_dataset("image", data=data, dtype="float32")
+                dataset.attrs["n_frames"] = frames
 
         # Save the PNG
         png_filename = f"png/frame_{self.idx:03d}.png"
-        image = Image.fromarray((data * 255 / np.max(data)).astype(np.uint8))
+        # Scaled in place, the raw data is already written
+        np.multiply(data, 255 / max(np.max(data), 1), out=data)
+        image = Image.fromarray(data.astype(np.uint8))
         with self.mounted_fs.open(png_filename, "wb") as png_file:
             image.save(png_file, format="PNG")
         
@@ -54,6 +72,7 @@ class AcquisitionRunner:
                 "operator": self.acquisition_parser.acquisition.operator,
                 "metadata": self.acquisition_parser.acquisition.metadata,
                 "num_steps": self.acquisition_parser.acquisition.num_steps,
+                "burst_reduce": self.acquisition_parser.acquisition.burst_reduce,
                 "steps": [
                     {
                         "step": step.step,
@@ -64,6 +83,7 @@ class AcquisitionRunner:
                         "phi_g": step.phi_g,
                         "phi_a": step.phi_a,
                         "flt_a": step.flt_a,
+                        "n_frames": step.n_frames,
                     }
                     for step in self.acquisition_parser.steps
                 ],
@@ -81,7 +101,7 @@ class AcquisitionRunner:
             for idx, step in enumerate(self.acquisition_parser.steps):
                 self.idx = idx
                 # Send message to client - step parameters
-                self.system.sendMessage(repr(step))
+                self.system.sendMessage(repr(step), Topics.ACQ)
                 # Set step parameters and sleep
                 self.system.hs.wl = float(step.lam)
                 self.system.cam.exposure = float(step.t_int)
@@ -89,17 +109,25 @@ class AcquisitionRunner:
                 self.system.pol.rot1.positionDeg = float(step.phi_a)
                 self.system.pol.rot2.positionDeg = float(step.phi_g)
                 self.system.pol.flt1.positionPos = float(step.flt_a)
+                self.system.cam.setBurst(step.n_frames)
                 #self.system.focus.move_relative(float(step.z_pos))
                 #time.sleep(0.2)
                 # Acquire image and save
-                self.system.cam.triggerAcquisition()
                 self.cam_busy = True
+                self.system.cam.triggerAcquisition()
+                # A single trigger may start a whole burst, allow for all its frames
+                deadline = time.monotonic() + step.n_frames * (float(step.t_int) / 1000.0 + 1.0 / self.system.cam.maxFPS) + 5.0
                 while self.cam_busy:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("Step {} was not acquired in time".format(idx))
                     time.sleep(0.01)
                 
                 # Send message
-                self.system.sendMessage("{}: OK".format(idx))
+                self.system.sendMessage("{}: OK".format(idx), Topics.ACQ)
+                if self.progress:
+                    self.progress({"step": idx, "num_steps": len(self.acquisition_parser.steps)})
         finally:
+            self.system.cam.setBurst(1)
             self.cleanup()
 
     def prepare_acquisition_directory(self):
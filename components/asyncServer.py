@@ -0,0 +1,105 @@
+import asyncio
+import websockets
+from websockets.asyncio.server import serve
+from components.client import Client
+from components.serverBase import ServerBase
+
+class AsyncClient(Client):
+    ''' Client whose sender is a task on the server event loop. '''
+    def __init__(self, websocket, addr, loop, maxControl=1000):
+        super().__init__(websocket, addr, maxControl)
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+
+    def notify(self):
+        # Called from camera and hardware threads, hop onto the loop
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.notify()
+
+    async def run(self):
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                # Drain everything queued since the last wake-up
+                while not self.closed and (data := self.pop()) is not None:
+                    await self.websocket.send(data)
+                    self.sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            with self.lock:
+                self.closed = True
+            await self.websocket.close()
+
+class AsyncWebSocketServer(ServerBase):
+    ''' Drop-in alternative to WebSocketServer running all connections on one event loop. '''
+    def __init__(self, ctx, host="localhost", port=1234, password="", handler=None, ssl_context=None):
+        super().__init__(ctx, host, port, password, handler, ssl_context)
+        self.loop = None
+        self.stopped = None
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        async with serve(self.handle_client, self.host, self.port, ssl=self.ssl_context, max_size=10**7):
+            print("Server started (asyncio).")
+            await self.stopped.wait()
+
+    def stop(self):
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def authenticate(self, ws, addr):
+        # Receive the password from the client
+        password = await ws.recv()
+        if password == self.password:
+            print(f"[{addr[0]}] Authentication successful.")
+            await ws.send("Authenticated")
+            # Add client to the set
+            client = AsyncClient(ws, addr[0], self.loop)
+            self._addClient(client)
+            # Return the client for successful authentication
+            return client
+        else:
+            print(f"[{addr[0]}] Authentication failed.")
+            # Authentication failed, close the connection
+            await ws.close(code=1008, reason="Authentication failed")
+            # Return None on failed authentication
+            return None
+
+    async def handle_client(self, websocket):
+        ip = websocket.remote_address
+        print(f"[{ip[0]}] Client connected.")
+        # Compare the received password with the expected password
+        client = await self.authenticate(websocket, ip)
+        if client:
+            sender = asyncio.create_task(client.run())
+            # Listen for messages!
+            try:
+                while True:
+                    message = await websocket.recv()
+                    if not message:
+                        break
+                    # The handler only queues the command, hardware runs on its own thread
+                    response = self.handler.handle_request(message, client)
+                    if response:
+                        client.enqueue(response)
+            # Notify abrupt connection drop
+            except websockets.exceptions.ConnectionClosedError:
+                print(f"[{ip[0]}] Connection stopping abnormally!")
+            except websockets.exceptions.ConnectionClosedOK:
+                print(f"[{ip[0]}] Connection stopping gracefully!")
+            # Notify connection stop
+            finally:
+                print(f"[{ip[0]}] Connection closed.")
+                self._removeClient(client)
+                await sender
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+class FrameAverager:
+    ''' Averages camera frames into a preallocated accumulator.
+
+    "mean" sums count frames in uint32 and emits their mean once every count
+    frames. "ema" keeps an exponential moving average in float32 with weight
+    1/count and emits every frame. The result is written into the last frame
+    passed in, so no output buffer is allocated.
+    '''
+    MODES = ("mean", "ema")
+
+    def __init__(self, count, mode="mean"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown averaging mode: {mode}")
+        self.count = max(1, int(count))
+        self.mode = mode
+        self.acc = None
+        self.scratch = None
+        self.frames = 0
+
+    def reset(self):
+        self.frames = 0
+
+    def add(self, data):
+        ''' Accumulate a frame, returns the average or None while accumulating. '''
+        if self.acc is None or self.acc.shape != data.shape:
+            self.acc = np.zeros(data.shape, np.uint32 if self.mode == "mean" else np.float32)
+            self.scratch = np.empty(data.shape, np.float32) if self.mode == "ema" else None
+            self.frames = 0
+        # Frames straight from the SDK are read-only
+        if not data.flags.writeable:
+            data = data.copy()
+
+        if self.mode == "mean":
+            if self.frames == 0:
+                np.copyto(self.acc, data)
+            else:
+                np.add(self.acc, data, out=self.acc)
+            self.frames += 1
+            if self.frames < self.count:
+                return None
+            # Rounded integer mean
+            np.add(self.acc, self.count // 2, out=self.acc)
+            np.floor_divide(self.acc, self.count, out=self.acc)
+            np.copyto(data, self.acc, casting="unsafe")
+            self.frames = 0
+            return data
+
+        if self.frames == 0:
+            np.copyto(self.acc, data)
+        else:
+            cv2.accumulateWeighted(data, self.acc, 1.0 / self.count)
+        self.frames += 1
+        np.add(self.acc, 0.5, out=self.scratch)
+        np.copyto(data, self.scratch, casting="unsafe")
+        return data
+
+    def state(self):
+        return {"mode": self.mode, "count": self.count}
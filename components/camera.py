@@ -1,33 +1,17 @@
 import gxipy as gx
+import ctypes
 import time
 import numpy as np
-from enum import Enum
+from components.cameraBase import CameraBase
 
-class GetCamerasCamera:
-    class CameraModes(Enum):
-        ''' Camera modes contain a list of configuration to perform specific tasks.'''
-        SNAPSHOT = 1
-        LIVE = 2            
-        ACQUISITION = 3
+class GetCamerasCamera(CameraBase):
+    ''' Daheng Galaxy camera, frame handling is inherited from CameraBase. '''
+    _triggerLocked = (gx.InvalidAccess,)
 
-    def __init__(self, live_callback, snapshot_callback, acquire_callback, maxFPS = 10.0, exposureCallback=None, gainCallback=None):
-        self.live_callback = live_callback
-        self.snapshot_callback = snapshot_callback
-        self.acquire_callback = acquire_callback
-
-        self.maxFPS = maxFPS
-
-        self.connected = False
+    def __init__(self, live_callback, snapshot_callback, acquire_callback, maxFPS = 10.0, exposureCallback=None, gainCallback=None, ringFrames=0):
+        super().__init__(live_callback, snapshot_callback, acquire_callback, maxFPS, exposureCallback, gainCallback, ringFrames)
         self.stream = None
 
-        self.exposureCallback = exposureCallback
-        self.gainCallback = gainCallback
-
-        self.__gain = 1.0
-        self.__exposure = 100.0
-        self.__frameRate = 10.0
-        self.__mode = None
-
         self.__connect()
         self.__initialize()
 
@@ -39,149 +23,116 @@ class GetCamerasCamera:
         if self.connected:
             self.__disconnect()
 
-    @property
-    def gain(self):
-        if self.connected:
-            self.__gain = self.__device.Gain.get()
-        return self.__gain
-
-    @gain.setter
-    def gain(self, value: float):
-        # TODO: TYPE and VALUE CHECKING!!!
-        self.__gain = value
-        if self.connected:
-            print("Setting gain to: {}".format(self.__gain))
-            self.__device.Gain.set(self.__gain)
-        if self.gainCallback:
-            self.gainCallback(value)
-
-    @property
-    def exposure(self):
-        if self.connected:
-            self.__exposure = self.__device.ExposureTime.get()/1000
-        return self.__exposure
-
-    @exposure.setter
-    def exposure(self, value: float):
-        # TODO: TYPE and VALUE CHECKING!!!
-        self.__exposure = value
-        if self.connected:
-            print("Setting exposure to [ms]: {}".format(self.__exposure))
-            self.__device.ExposureTime.set(self.__exposure*1000.0)
-            self.frameRate = self.maxFPS
-        if self.exposureCallback:
-            self.exposureCallback(value)
-
-    @property
-    def frameRate(self):
-        if self.connected:
-            self.__frameRate = self.__device.AcquisitionFrameRate.get()
-        return self.__frameRate
-    
-    @frameRate.setter
-    def frameRate(self, fps: float):
-        # TODO: TYPE and VALUE CHECKING!!!
-        self.__frameRate = min(fps, 1000/self.exposure)
-        if self.connected:
-            print("Setting FrameRate to: {}".format(self.__frameRate))
-            self.__device.AcquisitionFrameRate.set(self.__frameRate)
-
-    @property
-    def mode(self):
-        return self.__mode
-    
-    @mode.setter
-    def mode(self, mode: CameraModes):
-        # TODO: TYPE and VALUE CHECKING!!!
-        # If new mode is the same as the current, do nothing!
-        if mode == self.__mode:
-            return
-
-        # If we have a stream, stop it
-        if self.stream:
-            self.__device.stream_off()
-            self.stream = None
-        
-        # Configure for snapshot mode. This is the default.
-        if mode == self.CameraModes.SNAPSHOT:
-            # Notify the terminal
-            print("Entering SNAPSHOT mode...")
-            # Define the callback
-            def callback(raw_image):
-                data = raw_image.get_numpy_array()
-                self.snapshot_callback(data)
-
-            # Set software trigger
+    def __frame(self, raw_image):
+        # Single copy from the SDK buffer into a pooled frame
+        data = self.pool.acquire() if self.pool else None
+        if data is None:
+            return raw_image.get_numpy_array()
+        frame = raw_image.frame_data
+        if (frame.height, frame.width) != data.shape or frame.image_size < data.nbytes:
+            self.pool.release(data)
+            return raw_image.get_numpy_array()
+        ctypes.memmove(data.ctypes.data, frame.image_buf, data.nbytes)
+        return data
+
+    def __capture(self, raw_image):
+        # The one callback registered with the SDK
+        self._route(self.__frame(raw_image), raw_image.get_frame_id(), raw_image.get_timestamp())
+
+    def __burstAvailable(self):
+        # Not writable while streaming on some models, writes then go through the stream restart
+        return self.__device.AcquisitionBurstFrameCount.is_implemented()
+
+    def __burstTrigger(self, enable):
+        # Software trigger on the burst start, FRAME_START is selected again afterwards
+        self.__device.TriggerSelector.set(gx.GxTriggerSelectorEntry.FRAME_BURST_START)
+        if enable:
             self.__device.TriggerMode.set(gx.GxSwitchEntry.ON)
             self.__device.TriggerSource.set(gx.GxTriggerSourceEntry.SOFTWARE)
+        else:
+            self.__device.TriggerMode.set(gx.GxSwitchEntry.OFF)
+        self.__device.TriggerSelector.set(gx.GxTriggerSelectorEntry.FRAME_START)
+
+    def _configureBurst(self, frames):
+        if not self.__burstAvailable():
+            return False
+        self.__device.AcquisitionBurstFrameCount.set(frames)
+        self._burstHardware = frames > 1
+        # Other modes arm or disarm the burst when they are entered
+        if self.mode == self.CameraModes.ACQUISITION:
+            self._configureTrigger(self.mode)
+        return self._burstHardware
+
+    def __allocatePool(self, count=4):
+        # MONO8 fits a byte, every other mono format is delivered as 16 bit
+        if self.__device.PixelFormat.get()[0] == gx.GxPixelFormatEntry.MONO8:
+            dtype = np.uint8
+        else:
+            dtype = np.uint16
+        shape = (self.__device.Height.get(), self.__device.Width.get())
+        self._allocateBuffers(shape, dtype, count)
+
+    def _configureTrigger(self, mode):
+        # Either the burst start or the frame start is triggered, never both
+        burst = self._burstHardware and mode == self.CameraModes.ACQUISITION
+        if self.__burstAvailable():
+            self.__burstTrigger(burst)
+        else:
+            self.__device.TriggerSelector.set(gx.GxTriggerSelectorEntry.FRAME_START)
+
+        # Snapshot and acquisition are software triggered
+        if mode in (self.CameraModes.SNAPSHOT, self.CameraModes.ACQUISITION):
+            self.__device.TriggerMode.set(gx.GxSwitchEntry.OFF if burst else gx.GxSwitchEntry.ON)
+            self.__device.TriggerSource.set(gx.GxTriggerSourceEntry.SOFTWARE)
             self.__device.AcquisitionFrameRateMode.set(gx.GxSwitchEntry.OFF)
 
-            # Get the stream
-            self.stream = self.__device.data_stream[0]
-
-            # Register the callback
-            self.stream.register_capture_callback(callback)
-
-            # Start streaming
-            self.__device.stream_on()
-            time.sleep(0.1)
-        
-        # Configure for live streaming.
+        # Disable trigger and enable framerate mode for live streaming
         if mode == self.CameraModes.LIVE:
-            # Notify the terminal
-            print("Entering LIVE mode...")
-            # Define the callback
-            def callback(raw_image):
-                data = raw_image.get_numpy_array()
-                self.live_callback(data)
-
-            # Disable trigger and enable framerate mode
             self.__device.TriggerMode.set(gx.GxSwitchEntry.OFF)
             self.__device.AcquisitionFrameRateMode.set(gx.GxSwitchEntry.ON)
             self.frameRate = self.maxFPS
 
-            # Get the stream
-            self.stream = self.__device.data_stream[0]
-        
-            # Register the callback
-            self.stream.register_capture_callback(callback)
-
-            # Start the stream
-            self.__device.stream_on()
-            time.sleep(0.1)
-            self.__device.AcquisitionStart.send_command()
-        
-        # Configure for acquisition.
-        if mode == self.CameraModes.ACQUISITION:
-            # Notify the terminal
-            print("Entering ACQUISITION mode...")
-            # Define the callback
-            def callback(raw_image):
-                data = raw_image.get_numpy_array()
-                self.acquire_callback(data)
-            
-            # Set software trigger
-            self.__device.TriggerMode.set(gx.GxSwitchEntry.ON)
-            self.__device.TriggerSource.set(gx.GxTriggerSourceEntry.SOFTWARE)
-            self.__device.AcquisitionFrameRateMode.set(gx.GxSwitchEntry.OFF)
+    def _softwareTrigger(self):
+        # TriggerSoftware fires the selected trigger, which is the armed burst start in acquisition
+        burst = self._burstHardware and self.mode == self.CameraModes.ACQUISITION
+        if burst:
+            self.__device.TriggerSelector.set(gx.GxTriggerSelectorEntry.FRAME_BURST_START)
+        try:
+            self.__device.TriggerSoftware.send_command()
+        finally:
+            if burst:
+                self.__device.TriggerSelector.set(gx.GxTriggerSelectorEntry.FRAME_START)
+
+    def _clock(self):
+        # Device time, the clock of the frame timestamps
+        if not self.__device.TimestampLatch.is_implemented():
+            return None
+        self.__device.TimestampLatch.send_command()
+        return self.__device.TimestampLatchValue.get()
 
-            # Get the stream
-            self.stream = self.__device.data_stream[0]
+    def _startStream(self):
+        # Get the stream
+        self.stream = self.__device.data_stream[0]
 
-            # Register the callback
-            self.stream.register_capture_callback(callback)
+        # One callback for the lifetime of the stream
+        self.stream.register_capture_callback(self.__capture)
+        if self.ring:
+            self.ring.restart()
 
-            # Start streaming
-            self.__device.stream_on()
-            time.sleep(0.1)
+        # Start the stream
+        self.__device.stream_on()
+        time.sleep(0.1)
+        self.__device.AcquisitionStart.send_command()
 
-        # Finally, set the property to the now active mode
-        self.__mode = mode
+    def _stopStream(self):
+        if self.stream:
+            self.__device.stream_off()
+            self.stream = None
 
     def __initialize(self):
         # Configure default values for the camera
         print("Setting default settings...")
-        
+
         # Set MONO16 mode
         self.__device.PixelFormat.set(gx.GxPixelFormatEntry.MONO12)
 
@@ -203,24 +154,34 @@ class GetCamerasCamera:
         self.__device.BinningHorizontal.set(1)
         self.__device.BinningVerticalMode.set(gx.GxBinningVerticalModeEntry.SUM)
         self.__device.BinningVertical.set(1)
-        
+
+        # Frame size and format are final, size the buffer pool
+        self.__allocatePool()
+
         # Disable all delays
         self.__device.TriggerDelay.set(0.0)
         self.__device.ExposureDelay.set(0.0)
 
         # Set gain manual and default
         self.__device.GainAuto.set(gx.GxAutoEntry.OFF)
-        self.__device.Gain.set(self.__gain)
+        self._gain.set(self._gain.value, force=True)
         print("...Setting gain: {}".format(self.gain))
 
         # Set exposure manual and default
         self.__device.ExposureAuto.set(gx.GxAutoEntry.OFF)
         self.__device.ExposureMode.set(gx.GxExposureModeEntry.TIMED)
-        self.__device.ExposureTime.set(self.__exposure*1000.0)
-        print("...Setting exposure time [ms]: {}".format(self.__exposure))
+        self._exposure.set(self._exposure.value, force=True)
+        print("...Setting exposure time [ms]: {}".format(self.exposure))
+
+        # The frame rate register only holds the default until written once
+        self._frameRate.set(min(self.maxFPS, 1000/self.exposure), force=True)
+        print("...Setting frame rate: {}".format(self.frameRate))
 
         self.mode = self.CameraModes.SNAPSHOT
 
+        # The stream stays on from here, mode changes only switch the trigger
+        self._startStream()
+
         print("Camera set up with default values!")
 
         return 0
@@ -235,7 +196,7 @@ class GetCamerasCamera:
         # Create a device manager and find devices
         self.__device_manager = gx.DeviceManager()
         dev_num, dev_info_list = self.__device_manager.update_device_list()
-        
+
         # Verify that devices are found
         if dev_num == 0:
             print("...No cameras found!")
@@ -249,6 +210,11 @@ class GetCamerasCamera:
         # Set connected to true
         self.connected = True
 
+        # Features are written through their shadow registers from now on
+        self._gain.attach(lambda: self.__device.Gain.get(), lambda value: self.__device.Gain.set(value))
+        self._exposure.attach(lambda: self.__device.ExposureTime.get() / 1000, lambda value: self.__device.ExposureTime.set(value * 1000.0))
+        self._frameRate.attach(lambda: self.__device.AcquisitionFrameRate.get(), lambda value: self.__device.AcquisitionFrameRate.set(value))
+
         return 0
 
     def __disconnect(self):
@@ -259,24 +225,14 @@ class GetCamerasCamera:
             return -1
 
         # Close the connection
+        self._stopStream()
         self.__device.close_device()
         self.__device = None
         print("Camera disconnected!")
 
         # Set connected to false
         self.connected = False
+        for register in (self._gain, self._exposure, self._frameRate):
+            register.attach(None, None)
 
         return 0
-
-    def triggerSnapshot(self):        
-        # This just assures snapshot mode
-        self.mode = self.CameraModes.SNAPSHOT
-
-        # Send an actual trigger
-        self.__device.TriggerSoftware.send_command()
-        print("Snapshot triggered...")
-
-    def triggerAcquisition(self):
-        # Send an actual trigger
-        self.__device.TriggerSoftware.send_command()
-        print("Frame triggered...")
\ No newline at end of file
@@ -0,0 +1,318 @@
+import threading
+import numpy as np
+from enum import Enum
+from components.framePool import FramePool
+from components.averager import FrameAverager
+from components.registers import ShadowRegister
+from components.frameRing import FrameRing
+
+class CameraBase:
+    ''' Frame handling shared by the camera backends, independent of any SDK.
+
+    Backends deliver every captured frame to _route() from their capture
+    thread and implement the hooks _configureTrigger(), _softwareTrigger(),
+    _startStream(), _stopStream() and optionally _configureBurst() and
+    _clock(), the current time in the unit of the frame timestamps.
+    '''
+    # Errors of _configureTrigger() meaning the trigger is locked while streaming
+    _triggerLocked = ()
+    # Significant bits of the delivered pixel values, the saturation level of the statistics
+    bits = 12
+
+    class CameraModes(Enum):
+        ''' Camera modes contain a list of configuration to perform specific tasks.'''
+        SNAPSHOT = 1
+        LIVE = 2
+        ACQUISITION = 3
+
+    def __init__(self, live_callback, snapshot_callback, acquire_callback, maxFPS = 10.0, exposureCallback=None, gainCallback=None, ringFrames=0):
+        self.live_callback = live_callback
+        self.snapshot_callback = snapshot_callback
+        self.acquire_callback = acquire_callback
+
+        self.maxFPS = maxFPS
+
+        self.connected = False
+
+        self.exposureCallback = exposureCallback
+        self.gainCallback = gainCallback
+
+        # Shadow registers, the device is only accessed on changes and after invalidate()
+        self._gain = ShadowRegister(1.0)
+        self._exposure = ShadowRegister(100.0)
+        self._frameRate = ShadowRegister(10.0)
+        # Read every written feature back from the device
+        self.verifyWrites = False
+        self._mode = None
+        # Frames with an older timestamp were started before the last mode switch
+        self.__validSince = None
+
+        # Captured frames are copied into these buffers, allocated once the format is known
+        self.pool = None
+        # The last ringFrames raw frames, kept for retrospective saving. Off by default,
+        # it costs ringFrames frames of memory and a second copy of every frame.
+        self.ringFrames = ringFrames
+        self.ring = None
+
+        # Averaging of live frames, None to pass every frame through
+        self.averager = None
+        # Averaging of the frames of one snapshot, set while it is taken
+        self.snapshotAverager = None
+        self.__snapshotFrame = threading.Event()
+        # Frames still to be delivered as snapshot
+        self.__snapshotFrames = 0
+        self.__snapshotLock = threading.Lock()
+
+        # Frames captured per acquisition trigger, delivered together as one stack
+        self.burst = 1
+        self._burstHardware = False
+        self.__burstStack = None
+        self.__burstIndex = 0
+        self.__acquiredFrame = threading.Event()
+
+    def stop(self):
+        pass
+
+    def releaseFrame(self, data):
+        ''' Return a frame passed to one of the callbacks to the pool. '''
+        if self.pool:
+            self.pool.release(data)
+
+    def _allocateBuffers(self, shape, dtype, count=4):
+        self.pool = FramePool(shape, dtype, count)
+        print("...Allocated {} frame buffers of {}x{} {}".format(count, shape[1], shape[0], np.dtype(dtype).name))
+        if self.ringFrames:
+            self.ring = FrameRing(shape, dtype, self.ringFrames)
+
+    def __handOver(self, callback, data):
+        # The callback owns the frame from here on, unless it fails
+        try:
+            callback(data)
+        except Exception:
+            self.releaseFrame(data)
+            raise
+
+    def __average(self, averager, data):
+        # The frame is either the average or consumed by the accumulator
+        result = averager.add(data)
+        if result is not data:
+            self.releaseFrame(data)
+        return result
+
+    def __collectBurst(self, data):
+        # Copy into the burst stack, which is handed over once complete
+        shape = (self.burst,) + data.shape
+        if self.__burstStack is None or self.__burstStack.shape != shape or self.__burstStack.dtype != data.dtype:
+            self.__burstStack = np.empty(shape, data.dtype)
+            self.__burstIndex = 0
+        self.__burstStack[self.__burstIndex] = data
+        self.releaseFrame(data)
+        self.__burstIndex += 1
+        if self.__burstIndex < self.burst:
+            return None
+        self.__burstIndex = 0
+        return self.__burstStack
+
+    def _configureBurst(self, frames):
+        # Returns True if the camera delivers all frames for a single trigger
+        return False
+
+    def _reconfigure(self, configure):
+        # Some models lock the trigger features while acquiring, configure with the stream off then
+        try:
+            return configure()
+        except self._triggerLocked as e:
+            print("...Trigger locked ({}), restarting stream".format(e))
+            self._stopStream()
+            try:
+                return configure()
+            finally:
+                self._startStream()
+
+    def _clock(self):
+        # None if the backend cannot tell, stale frames are not detected then
+        return None
+
+    def setBurst(self, frames):
+        ''' Capture frames back-to-back per acquisition trigger.
+
+        Uses the camera's frame burst if available, otherwise every frame is
+        triggered separately. The acquire callback gets a (frames, height,
+        width) stack instead of a single frame when frames is above 1.
+        '''
+        frames = max(1, int(frames))
+        if frames == self.burst:
+            return
+        self.burst = frames
+        self.__burstIndex = 0
+        self._burstHardware = self.connected and self._reconfigure(lambda: self._configureBurst(frames))
+        if self.connected:
+            print("Acquiring {} frame(s) per trigger{}".format(frames, "" if self._burstHardware or frames == 1 else " (software)"))
+
+    def setAveraging(self, count, mode="mean"):
+        ''' Average count live frames ("mean") or a moving average of weight 1/count ("ema"). '''
+        if count and int(count) > 1:
+            self.averager = FrameAverager(count, mode)
+        else:
+            self.averager = None
+        return self.averager.state() if self.averager else None
+
+    def invalidate(self):
+        ''' Read gain, exposure and frame rate from the device on next access. '''
+        for register in (self._gain, self._exposure, self._frameRate):
+            register.invalidate()
+
+    def registers(self):
+        return {"gain": self._gain.stats(), "exposure": self._exposure.stats(), "frameRate": self._frameRate.stats()}
+
+    @property
+    def gain(self):
+        return self._gain.get()
+
+    @gain.setter
+    def gain(self, value: float):
+        # TODO: TYPE and VALUE CHECKING!!!
+        # Unchanged values neither touch the device nor notify
+        if not self._gain.set(value, verify=self.verifyWrites):
+            return
+        if self.connected:
+            print("Setting gain to: {}".format(self._gain.value))
+        if self.gainCallback:
+            self.gainCallback(self._gain.value)
+
+    @property
+    def exposure(self):
+        return self._exposure.get()
+
+    @exposure.setter
+    def exposure(self, value: float):
+        # TODO: TYPE and VALUE CHECKING!!!
+        if not self._exposure.set(value, verify=self.verifyWrites):
+            return
+        if self.connected:
+            print("Setting exposure to [ms]: {}".format(self._exposure.value))
+            self.frameRate = self.maxFPS
+        if self.exposureCallback:
+            self.exposureCallback(self._exposure.value)
+
+    @property
+    def frameRate(self):
+        return self._frameRate.get()
+
+    @frameRate.setter
+    def frameRate(self, fps: float):
+        # TODO: TYPE and VALUE CHECKING!!!
+        if self._frameRate.set(min(fps, 1000/self.exposure), verify=self.verifyWrites) and self.connected:
+            print("Setting FrameRate to: {}".format(self._frameRate.value))
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: CameraModes):
+        # TODO: TYPE and VALUE CHECKING!!!
+        # If new mode is the same as the current, do nothing!
+        if mode == self._mode:
+            return
+
+        # Notify the terminal
+        print("Entering {} mode...".format(mode.name))
+
+        # The stream keeps running, only the trigger is reconfigured
+        try:
+            self._reconfigure(lambda: self._configureTrigger(mode))
+        except Exception as e:
+            print("...Entering {} mode failed: {!r}".format(mode.name, e))
+            raise
+        if mode == self.CameraModes.LIVE and self.averager:
+            self.averager.reset()
+
+        # Live frames still in flight must not be taken for triggered ones
+        self.__validSince = None if mode == self.CameraModes.LIVE else self._clock()
+
+        # Pending snapshot frames belong to the previous mode
+        with self.__snapshotLock:
+            self.__snapshotFrames = 0
+
+        # Finally, set the property to the now active mode
+        self._mode = mode
+
+    def _route(self, data, frameId, timestamp):
+        # Frames go where the current mode says
+        if self.ring:
+            self.ring.add(data, frameId, timestamp)
+        mode = self._mode
+        since = self.__validSince
+        if since is not None and timestamp < since:
+            # Started before the switch to a triggered mode
+            self.releaseFrame(data)
+            return
+        if mode == self.CameraModes.ACQUISITION:
+            if self.burst > 1:
+                data = self.__collectBurst(data)
+            self.__acquiredFrame.set()
+            if data is not None:
+                self.__handOver(self.acquire_callback, data)
+            return
+
+        with self.__snapshotLock:
+            snapshot = self.__snapshotFrames > 0
+            if snapshot:
+                self.__snapshotFrames -= 1
+
+        if snapshot:
+            averager = self.snapshotAverager
+            if averager:
+                data = self.__average(averager, data)
+            self.__snapshotFrame.set()
+            if data is not None:
+                self.__handOver(self.snapshot_callback, data)
+        elif mode == self.CameraModes.LIVE:
+            averager = self.averager
+            if averager:
+                data = self.__average(averager, data)
+            if data is not None:
+                self.__handOver(self.live_callback, data)
+        else:
+            # Nobody asked for it, e.g. a live frame still in flight
+            self.releaseFrame(data)
+
+    def triggerSnapshot(self, average=1):
+        # In live mode the next frames of the running stream are the snapshot,
+        # otherwise this just assures snapshot mode
+        live = self._mode == self.CameraModes.LIVE
+        if not live:
+            self.mode = self.CameraModes.SNAPSHOT
+
+        self.snapshotAverager = FrameAverager(average, "mean") if average > 1 else None
+        try:
+            # Each frame is requested after the previous one arrived
+            for _ in range(average):
+                self.__snapshotFrame.clear()
+                with self.__snapshotLock:
+                    self.__snapshotFrames += 1
+                if not live:
+                    # Send an actual trigger
+                    self._softwareTrigger()
+                if average > 1 and not self.__snapshotFrame.wait(self.exposure / 1000.0 + 1.0):
+                    raise TimeoutError("Snapshot frame did not arrive")
+        finally:
+            if average > 1:
+                self.snapshotAverager = None
+                with self.__snapshotLock:
+                    self.__snapshotFrames = 0
+        if average > 1:
+            print("Snapshot of {} frames averaged...".format(average))
+        else:
+            print("Snapshot triggered...")
+
+    def triggerAcquisition(self):
+        # Send an actual trigger, a hardware burst answers it with all frames
+        triggers = 1 if self._burstHardware else self.burst
+        for i in range(triggers):
+            self.__acquiredFrame.clear()
+            self._softwareTrigger()
+            if i < triggers - 1 and not self.__acquiredFrame.wait(self.exposure / 1000.0 + 1.0):
+                raise TimeoutError("Burst frame did not arrive")
+        print("Frame triggered...")
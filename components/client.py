@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import deque
+from components.frames import Codecs
+from components.handler import Topics
+
+class Client:
+    ''' Outbound state of a single authenticated connection.
+
+    Control messages are queued in order and never dropped. Droppable
+    messages (image frames, statistics) occupy one slot per topic where the
+    newest one wins.
+    Subclasses implement the actual sending and the wake-up of the sender.
+    '''
+    def __init__(self, websocket, addr, maxControl=1000):
+        self.websocket = websocket
+        self.addr = addr
+        self.maxControl = maxControl
+
+        self.lock = threading.Lock()
+        self.control = deque()
+        self.frames = {}
+        self.closed = False
+        # Tag of the last image frame actually sent
+        self.frameTag = None
+
+        # Subscribed topics and explicitly excluded subtopics
+        self.topics = set(Topics.DEFAULT)
+        self.excluded = set()
+
+        # Frame credits granted by the client, None for no flow control
+        self.credits = None
+
+        # Preview format requested by the client, None for the server default
+        self.viewport = None
+        self.codec = (Codecs.RAW, None)
+        # Live image as tile updates instead of whole frames
+        self.tiles = False
+        # Full 12 bit data instead of the 8 bit preview: None, Codecs.RAW or Codecs.ZLIB
+        self.fullDepth = None
+
+        # Heartbeat round-trip statistics in seconds
+        self.rtt = None
+        self.rttMin = None
+        self.rttMax = None
+        # Exponentially weighted moving average with weight 1/8, as TCP's SRTT
+        self.rttEwma = None
+        self.rttTotal = 0.0
+        self.jitter = 0.0
+        self.heartbeats = 0
+        self.heartbeatSeq = None
+        self.heartbeatsLost = 0
+
+        # Counters exposed through stats()
+        self.sent = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    def enqueue(self, data, droppable=False, tag=None, slot=Topics.IMG):
+        ''' Queue data for sending. Returns False if the client is gone.
+
+        Droppable data replaces the unsent data in the same slot. tag
+        identifies an image frame, see frameTag. A frame that is not
+        droppable, e.g. a snapshot, is always sent and uses no credit; it
+        supersedes the unsent frame in its slot.
+        '''
+        with self.lock:
+            if self.closed:
+                return False
+            if droppable:
+                # Latest frame wins, the unsent one is discarded
+                if self.frames.pop(slot, None) is not None:
+                    self.dropped += 1
+                self.frames[slot] = (data, tag)
+            else:
+                # Control messages are never dropped. A client that cannot
+                # keep up with them is disconnected instead.
+                if len(self.control) >= self.maxControl:
+                    self.overflows += 1
+                    self.closed = True
+                else:
+                    if tag is not None and self.frames.pop(slot, None) is not None:
+                        self.dropped += 1
+                    self.control.append((data, tag))
+            closed = self.closed
+        if closed:
+            print(f"[{self.addr}] Outbound queue overflow, dropping client!")
+            self.close()
+            return False
+        self.notify()
+        return True
+
+    def pop(self):
+        ''' Return the next message to send, control messages first. '''
+        with self.lock:
+            if self.control:
+                data, tag = self.control.popleft()
+                if tag is not None:
+                    self.frameTag = tag
+                return data
+            # Oldest slot first, so no topic starves the others
+            while self.frames:
+                slot = next(iter(self.frames))
+                data, tag = self.frames.pop(slot)
+                if slot == Topics.IMG:
+                    # Every image frame sent consumes a credit
+                    if self.credits is not None:
+                        if self.credits <= 0:
+                            self.dropped += 1
+                            continue
+                        self.credits -= 1
+                    self.frameTag = tag
+                return data
+            return None
+
+    def grant(self, credits):
+        ''' Add frame credits, None switches flow control off. '''
+        if credits is not None and (isinstance(credits, bool) or not isinstance(credits, int)):
+            raise ValueError(f"Credits must be an integer or null, got {credits!r}")
+        with self.lock:
+            if credits is None:
+                self.credits = None
+            else:
+                self.credits = max(0, (self.credits or 0) + credits)
+            return self.credits
+
+    def wantsFrames(self):
+        return self.credits is None or self.credits > 0
+
+    def heartbeat(self, data):
+        ''' Update the round-trip statistics from an echoed heartbeat. '''
+        try:
+            seq = int(data["seq"])
+            rtt = time.monotonic() - float(data["t"])
+        except (TypeError, KeyError, ValueError):
+            return
+        with self.lock:
+            if self.heartbeatSeq is not None and seq > self.heartbeatSeq + 1:
+                self.heartbeatsLost += seq - self.heartbeatSeq - 1
+            self.heartbeatSeq = seq
+            if self.rtt is None:
+                self.rttMin = self.rttMax = self.rttEwma = rtt
+            else:
+                # Smoothed as in TCP, interarrival jitter as in RFC 3550
+                self.rttEwma += (rtt - self.rttEwma) / 8
+                self.jitter += (abs(rtt - self.rtt) - self.jitter) / 16
+                self.rttMin = min(self.rttMin, rtt)
+                self.rttMax = max(self.rttMax, rtt)
+            self.rtt = rtt
+            self.rttTotal += rtt
+            self.heartbeats += 1
+
+    def subscribe(self, subscribe=(), unsubscribe=()):
+        ''' Topics are lists of strings, nothing changes if either is not. '''
+        for topics in (subscribe, unsubscribe):
+            if not isinstance(topics, (list, tuple)) or not all(isinstance(topic, str) for topic in topics):
+                raise ValueError(f"Topics must be a list of strings, got {topics!r}")
+        with self.lock:
+            for topic in subscribe:
+                self.topics.add(topic)
+                self.excluded.discard(topic)
+            for topic in unsubscribe:
+                self.topics.discard(topic)
+                self.excluded.add(topic)
+
+    def subscribed(self, topic):
+        ''' None is the topic of messages every client receives. '''
+        if topic is None:
+            return True
+        # "val:focus" is covered by "val" unless excluded on its own
+        if topic in self.excluded:
+            return False
+        return topic in self.topics or topic.split(":")[0] in self.topics
+
+    def subscriptions(self):
+        with self.lock:
+            return sorted(self.topics)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "address": self.addr,
+                "topics": sorted(self.topics),
+                "credits": self.credits,
+                "codec": [self.codec[0].name, self.codec[1]],
+                "fullDepth": self.fullDepth.name if self.fullDepth else None,
+                "queued": len(self.control),
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "overflows": self.overflows,
+                "rtt": {
+                    "last": self.rtt,
+                    "ewma": self.rttEwma,
+                    "mean": self.rttTotal / self.heartbeats if self.heartbeats else None,
+                    "min": self.rttMin,
+                    "max": self.rttMax,
+                    "jitter": self.jitter,
+                    "count": self.heartbeats,
+                    "lost": self.heartbeatsLost,
+                },
+            }
+
+    def notify(self):
+        ''' Wake up the sender, implemented by the server specific client. '''
+        raise NotImplementedError
+
+    def close(self):
+        ''' Stop the sender and close the connection. '''
+        raise NotImplementedError
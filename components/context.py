@@ -6,8 +6,25 @@ class Context:
         self.server = None
         self.system = None
 
-    def sender(self, data):
-        self.server.broadcast(data)
+    def sender(self, data, droppable=False, topic=None):
+        self.server.broadcast(data, droppable, topic)
 
-    def reciever(self, data):
-        self.system.parseCommand(data)
\ No newline at end of file
+    def senderEncoded(self, encoder, droppable=True, topic=None, tag=None):
+        self.server.broadcastEncoded(encoder, droppable, topic, tag)
+
+    def subscribed(self, topic, frames=False):
+        return self.server.hasSubscribers(topic, frames)
+
+    def reciever(self, cmd):
+        return self.system.parseCommand(cmd.data, cmd)
+
+    def resendValues(self, client, modules=None):
+        # The system is created after the server, clients may connect before
+        if self.system:
+            self.system.sendCurrentValues(client, modules)
+
+    def isSetting(self, data):
+        return self.system.isSetting(data)
+
+    def setting(self, cmd):
+        return self.system.parseSetting(cmd.data["data"], cmd.client)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import threading
+import multiprocessing as mp
+import numpy as np
+from multiprocessing import shared_memory
+from components.frames import Codecs
+from components.preview import encodePreviewTimed
+
+def encoderMain(conn):
+    ''' Entry point of the worker process, answers encode requests until None is received. '''
+    shm = None
+    while (request := conn.recv()) is not None:
+        name, offset, shape, dtype, seq, contrast, timestamp, view, codec = request
+        try:
+            # Attach to the ring, it is replaced when the frame size grows
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=name)
+            data = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            result = encodePreviewTimed(data, seq, timestamp, view, (Codecs(codec[0]), codec[1]), contrast)
+            # Release the view, the segment cannot be closed while it exists
+            del data
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    if shm is not None:
+        shm.close()
+
+class EncoderProcess:
+    ''' Preview conversion and encoding in a separate process.
+
+    Raw frames are copied into a ring of slots in shared memory, only the
+    slot position and the requested format travel through the pipe.
+    '''
+    def __init__(self, slots=4):
+        self.slots = slots
+        self.slotSize = 0
+        self.shm = None
+        self.next = 0
+        self.lock = threading.Lock()
+
+        # Spawn, forking a process with running camera and serial threads is unsafe
+        context = mp.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=encoderMain, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        with self.lock:
+            self.conn.send(None)
+        self.process.join(timeout=1.0)
+        self.__release()
+
+    def __release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def put(self, data):
+        ''' Copy a frame into the next ring slot and return its handle. '''
+        with self.lock:
+            if data.nbytes > self.slotSize:
+                # Frame size grew, replace the ring
+                self.__release()
+                self.slotSize = data.nbytes
+                self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slotSize)
+            offset = self.next * self.slotSize
+            self.next = (self.next + 1) % self.slots
+            slot = np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf, offset=offset)
+            slot[...] = data
+            return (self.shm.name, offset, data.shape, data.dtype.str)
+
+    def encode(self, slot, seq, contrast, timestamp, view, codec):
+        ''' Encode the frame in slot in the worker, blocks until done.
+
+        Returns (frame, seconds) with the codec time measured in the worker.
+        '''
+        name, offset, shape, dtype = slot
+        with self.lock:
+            self.conn.send((name, offset, shape, dtype, seq, contrast, timestamp, view, (codec[0].value, codec[1])))
+            status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Preview encoder failed: {result}")
+        return result
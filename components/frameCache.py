@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future
+
+class FrameCache:
+    ''' Encodings of the newest frame keyed by (sequence, view, codec).
+
+    The first caller asking for a key runs the encoder, concurrent callers for
+    the same key wait for its result. All entries are evicted as soon as a
+    frame with a higher sequence number is requested.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = None
+        self.entries = {}
+        # Statistics
+        self.encoded = 0
+        self.hits = 0
+
+    def get(self, seq, view, codec, encoder):
+        ''' Return encoder(view, codec) for frame seq, encoding at most once. '''
+        key = (seq, view, codec)
+        with self.lock:
+            if self.seq is None or seq > self.seq:
+                # A newer frame supersedes everything cached so far
+                self.seq = seq
+                self.entries = {}
+            if seq < self.seq:
+                # Late request for a superseded frame, do not cache it
+                future = None
+            else:
+                future = self.entries.get(key)
+                if future is None:
+                    future = Future()
+                    self.entries[key] = future
+                    self.encoded += 1
+                    owner = True
+                else:
+                    self.hits += 1
+                    owner = False
+
+        if future is None:
+            return encoder(view, codec)
+        if owner:
+            try:
+                future.set_result(encoder(view, codec))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def clear(self):
+        with self.lock:
+            self.seq = None
+            self.entries = {}
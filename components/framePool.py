@@ -0,0 +1,39 @@
+import threading
+import numpy as np
+
+class FramePool:
+    ''' Preallocated frame buffers, reused instead of allocating per frame.
+
+    acquire() hands out a free buffer or None if all are in use. Whoever ends
+    up holding the buffer returns it with release() when done. Arrays that do
+    not belong to the pool are ignored by release(), so consumers may release
+    every frame they get.
+    '''
+    def __init__(self, shape, dtype, count=4):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.lock = threading.Lock()
+        # Held for the lifetime of the pool, so ownership is checked by identity
+        self.buffers = tuple(np.empty(self.shape, self.dtype) for _ in range(count))
+        self.free = list(self.buffers)
+        # Number of times no buffer was free
+        self.misses = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.misses += 1
+            return None
+
+    def release(self, buffer):
+        if buffer is None or not any(buffer is owned for owned in self.buffers):
+            return
+        with self.lock:
+            if not any(buffer is free for free in self.free):
+                self.free.append(buffer)
+
+    def stats(self):
+        with self.lock:
+            return {"buffers": self.count, "free": len(self.free), "misses": self.misses}
@@ -0,0 +1,60 @@
+import threading
+import h5py
+import numpy as np
+
+class FrameRing:
+    ''' The last raw frames of the camera with their frame ids and timestamps.
+
+    Frames are copied into a preallocated (count, height, width) array, the
+    oldest one is overwritten. Gaps in the frame ids are counted as dropped
+    frames.
+    '''
+    def __init__(self, shape, dtype, count=16):
+        self.count = count
+        self.lock = threading.Lock()
+        self.frames = np.empty((count,) + tuple(shape), dtype)
+        self.ids = np.zeros(count, np.uint64)
+        self.timestamps = np.zeros(count, np.uint64)
+        # Total number of frames added, the next slot is added % count
+        self.added = 0
+        self.lastId = None
+        self.dropped = 0
+
+    def restart(self):
+        ''' The frame ids start over, e.g. after the stream was restarted. '''
+        with self.lock:
+            self.lastId = None
+
+    def add(self, data, frameId, timestamp):
+        if data.shape != self.frames.shape[1:]:
+            return
+        with self.lock:
+            slot = self.added % self.count
+            np.copyto(self.frames[slot], data, casting="unsafe")
+            self.ids[slot] = frameId
+            self.timestamps[slot] = timestamp
+            if self.lastId is not None and frameId > self.lastId + 1:
+                self.dropped += frameId - self.lastId - 1
+            self.lastId = frameId
+            self.added += 1
+
+    def last(self, frames):
+        ''' Copies of the last frames, ids and timestamps, oldest first. '''
+        with self.lock:
+            frames = min(frames, self.count, self.added)
+            slots = np.arange(self.added - frames, self.added) % self.count
+            return self.frames[slots], self.ids[slots], self.timestamps[slots]
+
+    def save(self, path, frames):
+        ''' Write the last frames to an HDF5 file, returns the number written. '''
+        data, ids, timestamps = self.last(frames)
+        with h5py.File(path, "w") as hdf:
+            hdf.create_dataset("frames", data=data)
+            hdf.create_dataset("frame_id", data=ids)
+            hdf.create_dataset("timestamp", data=timestamps)
+            hdf.attrs["dropped"] = self.dropped
+        return len(ids)
+
+    def stats(self):
+        with self.lock:
+            return {"frames": min(self.added, self.count), "size": self.count, "lastId": self.lastId, "dropped": self.dropped}
@@ -0,0 +1,168 @@
+import struct
+import time
+import numpy as np
+from enum import Enum
+from components.handler import MsgTypes
+from components.pack12 import decode12
+
+class Codecs(Enum):
+    ''' Encoding of the payload that follows the binary header. '''
+    RAW = 0         # Raw pixels, row-major
+    PNG = 1         # PNG, lossless
+    JPEG = 2        # JPEG, lossy
+    WEBP = 3        # WebP, lossless
+    ZLIB = 4        # Row-delta coded, then deflated, lossless
+
+class DTypes(Enum):
+    ''' Pixel data type of the image carried in a binary frame. '''
+    UINT8 = 0
+    UINT16 = 1
+    FLOAT32 = 2
+    UINT12 = 3      # Packed, two pixels in three bytes, see components/pack12.py
+
+# Mapping between numpy dtypes and the wire representation
+NUMPY_DTYPES = {
+    DTypes.UINT8: np.dtype(np.uint8),
+    DTypes.UINT16: np.dtype(np.uint16),
+    DTypes.FLOAT32: np.dtype(np.float32),
+    # Unpacked on the receiving side
+    DTypes.UINT12: np.dtype(np.uint16),
+}
+
+class ImageFrame:
+    ''' Binary IMG frame: fixed little-endian header followed by the payload. '''
+    # type, codec, dtype, reserved, sequence, width, height, timestamp,
+    # region of the sensor shown (x, y, width, height)
+    HEADER = struct.Struct("<BBBBIIIdIIII")
+
+    def __init__(self, seq, width, height, dtype, codec, timestamp, payload, roi=None):
+        self.seq = seq
+        self.width = width
+        self.height = height
+        self.dtype = dtype
+        self.codec = codec
+        self.timestamp = timestamp
+        self.payload = payload
+        # Without a region the frame shows the whole sensor at full resolution
+        self.roi = roi or (0, 0, width, height)
+
+    @classmethod
+    def fromArray(cls, seq, data, timestamp=None, roi=None):
+        ''' Build a RAW frame from a 2D numpy array. '''
+        dtype = next(k for k, v in NUMPY_DTYPES.items() if v == data.dtype)
+        height, width = data.shape
+        if timestamp is None:
+            timestamp = time.time()
+        payload = np.ascontiguousarray(data).tobytes()
+        return cls(seq, width, height, dtype, Codecs.RAW, timestamp, payload, roi)
+
+    def pack(self):
+        header = self.HEADER.pack(MsgTypes.IMG.value, self.codec.value, self.dtype.value, 0,
+                                  self.seq & 0xFFFFFFFF, self.width, self.height, self.timestamp, *self.roi)
+        return header + self.payload
+
+    @classmethod
+    def unpack(cls, message):
+        ''' Parse a binary frame as received by the client. '''
+        msgType, codec, dtype, _, seq, width, height, timestamp, *roi = cls.HEADER.unpack_from(message)
+        if msgType != MsgTypes.IMG.value:
+            raise ValueError(f"Not an image frame: {msgType}")
+        payload = memoryview(message)[cls.HEADER.size:]
+        return cls(seq, width, height, DTypes(dtype), Codecs(codec), timestamp, payload, tuple(roi))
+
+    def toArray(self):
+        ''' Decode a RAW or packed 12 bit payload back into a numpy array. '''
+        if self.dtype == DTypes.UINT12 and self.codec in (Codecs.RAW, Codecs.ZLIB):
+            return decode12(self.payload, (self.height, self.width), self.codec == Codecs.ZLIB)
+        if self.codec != Codecs.RAW:
+            raise ValueError(f"Cannot decode codec {self.codec.name} to array")
+        return np.frombuffer(self.payload, dtype=NUMPY_DTYPES[self.dtype]).reshape(self.height, self.width)
+
+
+class TileFrame:
+    ''' Binary TIL frame: tiles of a preview changed since the frame baseSeq.
+
+    Each tile is an independently encoded image of tileSize x tileSize pixels
+    (smaller at the right and bottom edges) at column and row of the tile grid.
+    '''
+    # type, codec, flags, reserved, sequence, base sequence, width, height, timestamp,
+    # region of the sensor shown (x, y, width, height), tile size, reserved, tile count
+    HEADER = struct.Struct("<BBBBIIIIdIIIIHHI")
+    # column, row, payload length
+    TILE = struct.Struct("<HHI")
+    KEYFRAME = 0x01
+
+    def __init__(self, seq, baseSeq, width, height, codec, timestamp, tileSize, tiles, keyframe=False, roi=None):
+        self.seq = seq
+        self.baseSeq = baseSeq
+        self.width = width
+        self.height = height
+        self.codec = codec
+        self.timestamp = timestamp
+        self.tileSize = tileSize
+        # List of (column, row, payload)
+        self.tiles = tiles
+        self.keyframe = keyframe
+        self.roi = roi or (0, 0, width, height)
+
+    def pack(self):
+        flags = self.KEYFRAME if self.keyframe else 0
+        parts = [self.HEADER.pack(MsgTypes.TIL.value, self.codec.value, flags, 0,
+                                  self.seq & 0xFFFFFFFF, (self.baseSeq or 0) & 0xFFFFFFFF,
+                                  self.width, self.height, self.timestamp, *self.roi,
+                                  self.tileSize, 0, len(self.tiles))]
+        for column, row, payload in self.tiles:
+            parts.append(self.TILE.pack(column, row, len(payload)))
+            parts.append(payload)
+        return b"".join(parts)
+
+    @classmethod
+    def unpack(cls, message):
+        ''' Parse a binary tile frame as received by the client. '''
+        msgType, codec, flags, _, seq, baseSeq, width, height, timestamp, *rest = cls.HEADER.unpack_from(message)
+        if msgType != MsgTypes.TIL.value:
+            raise ValueError(f"Not a tile frame: {msgType}")
+        roi, tileSize, count = tuple(rest[:4]), rest[4], rest[6]
+        view = memoryview(message)
+        offset = cls.HEADER.size
+        tiles = []
+        for _ in range(count):
+            column, row, length = cls.TILE.unpack_from(message, offset)
+            offset += cls.TILE.size
+            tiles.append((column, row, view[offset:offset + length]))
+            offset += length
+        return cls(seq, baseSeq, width, height, Codecs(codec), timestamp, tileSize, tiles, bool(flags & cls.KEYFRAME), roi)
+
+
+class StatsFrame:
+    ''' Binary STA frame: statistics and histogram of a raw camera frame. '''
+    # type, bit depth, reserved, reserved, sequence, timestamp, min, max, mean,
+    # saturated pixel count, total pixel count, histogram bins
+    HEADER = struct.Struct("<BBBBIdIIdIII")
+
+    def __init__(self, seq, timestamp, bits, minimum, maximum, mean, saturated, pixels, histogram):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.bits = bits
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.saturated = saturated
+        self.pixels = pixels
+        # uint32 counts, one per level
+        self.histogram = histogram
+
+    def pack(self):
+        histogram = np.ascontiguousarray(self.histogram, dtype="<u4")
+        header = self.HEADER.pack(MsgTypes.STA.value, self.bits, 0, 0, self.seq & 0xFFFFFFFF, self.timestamp,
+                                  self.minimum, self.maximum, self.mean, self.saturated, self.pixels, len(histogram))
+        return header + histogram.tobytes()
+
+    @classmethod
+    def unpack(cls, message):
+        ''' Parse a binary statistics frame as received by the client. '''
+        msgType, bits, _, _, seq, timestamp, minimum, maximum, mean, saturated, pixels, bins = cls.HEADER.unpack_from(message)
+        if msgType != MsgTypes.STA.value:
+            raise ValueError(f"Not a statistics frame: {msgType}")
+        histogram = np.frombuffer(message, dtype="<u4", count=bins, offset=cls.HEADER.size)
+        return cls(seq, timestamp, bits, minimum, maximum, mean, saturated, pixels, histogram)
@@ -1,4 +1,6 @@
 import json
+import queue
+import threading
 from enum import Enum
 
 class MsgTypes(Enum):
@@ -8,25 +10,168 @@ class MsgTypes(Enum):
     IMG = 4     # Image frame
     HRB = 5     # Heartbeat
     ACQ = 6     # Acquisition script
+    RSP = 7     # Command response (accepted, progress, done, error)
+    SUB = 8     # Topic subscription
+    CRD = 9     # Frame credits granted by the client
+    TIL = 10    # Tile update of the live image
+    STA = 11    # Frame statistics and histogram
+
+class Topics:
+    ''' Broadcast topics a client can subscribe to. '''
+    IMG = "img"     # Image frames
+    VAL = "val"     # Value updates, per module as "val:<module>"
+    ACQ = "acq"     # Acquisition progress
+    HRB = "hrb"     # Heartbeats
+    STA = "sta"     # Frame statistics
+
+    # Clients start subscribed to everything
+    DEFAULT = (IMG, VAL, ACQ, HRB, STA)
+
+    @staticmethod
+    def val(module):
+        return f"{Topics.VAL}:{module}"
+
+class Command:
+    ''' A request from a client, optionally tagged with a client-supplied id. '''
+    def __init__(self, data, client=None):
+        self.data = data
+        self.id = data.get("id") if isinstance(data, dict) else None
+        self.client = client
+
+    def reply(self, status, data=None):
+        # Only commands carrying an id get responses, and only to their client
+        if self.id is None or self.client is None:
+            return
+        msg = {"type": MsgTypes.RSP.value, "id": self.id, "status": status, "data": data}
+        self.client.enqueue(json.dumps(msg))
+
+    def accepted(self):
+        self.reply("accepted")
+
+    def progress(self, data):
+        self.reply("progress", data)
+
+    def done(self, data=None):
+        self.reply("done", data)
+
+    def error(self, message):
+        self.reply("error", message)
+
+class CommandRunner(threading.Thread):
+    ''' Executes commands in order on a single thread, off the receive loops. '''
+    def __init__(self, ctx):
+        super().__init__(daemon=True)
+        self.ctx = ctx
+        self.queue = queue.Queue()
+
+    def submit(self, cmd):
+        self.queue.put(cmd)
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        while (cmd := self.queue.get()) is not None:
+            try:
+                result = self.ctx.reciever(cmd)
+                cmd.done(result)
+            except Exception as e:
+                print(f"Command {cmd.id} failed: {e!r}")
+                cmd.error(str(e))
 
 class Handler:
     def __init__(self, ctx):
         # Context binding
         self.ctx = ctx
         self.ctx.handler = self
+        # Commands are executed on their own thread
+        self.runner = CommandRunner(ctx)
+        self.runner.start()
+
+    def stop(self):
+        self.runner.stop()
 
-    def handle_request(self, payload, peer):
+    def handle_request(self, payload, client):
         try:
             data = json.loads(payload)
-            # Process the received JSON data here
-            print(f"[{peer}] Received vaid JSON:", data)
-            self.ctx.reciever(data)
-            # Acknowledge
-            response = {"type":MsgTypes.MSG.value, "status": "success", "data": "Received"}
-            # Return the response
-            return json.dumps(response)
+            if not isinstance(data, dict):
+                print(f"[{client.addr}] Received JSON that is not an object:", payload)
+                return json.dumps({"status": "error", "message": "Request must be a JSON object"})
+            cmd = Command(data, client)
+            # Subscriptions only concern the connection, handle them right here
+            if data.get("type") == MsgTypes.SUB.value:
+                return self.handle_subscription(cmd)
+            if data.get("type") == MsgTypes.CRD.value:
+                return self.handle_credits(cmd)
+            if data.get("type") == MsgTypes.HRB.value:
+                cmd.client.heartbeat(data.get("data"))
+                return None
+            # Not logged above, credits arrive for every rendered frame
+            print(f"[{client.addr}] Received vaid JSON:", data)
+            # Settings of this connection must not wait for queued commands
+            if self.ctx.isSetting(data):
+                return self.handle_setting(cmd)
+            # Acknowledge before queueing, so it precedes progress and completion
+            if cmd.id is not None:
+                cmd.accepted()
+                response = None
+            else:
+                response = json.dumps({"type":MsgTypes.MSG.value, "status": "success", "data": "Received"})
+            # Execute off the receive loop
+            self.runner.submit(cmd)
+            # Return the response, if any
+            return response
         except json.JSONDecodeError:
-            print(f"[{peer}] Received invalid JSON:", payload)
+            print(f"[{client.addr}] Received invalid JSON:", payload)
             # Example error response
             response = {"status": "error", "message": "Invalid JSON format"}
-            return json.dumps(response)
\ No newline at end of file
+            return json.dumps(response)
+
+    def reject(self, cmd, message):
+        # Error response to commands with an id, plain error message otherwise
+        print(f"[{cmd.client.addr}] Rejected request: {message}")
+        if cmd.id is not None:
+            cmd.error(message)
+            return None
+        return json.dumps({"status": "error", "message": message})
+
+    def handle_subscription(self, cmd):
+        request = cmd.data.get("data") or {}
+        if not isinstance(request, dict):
+            return self.reject(cmd, "Subscription data must be an object")
+        try:
+            cmd.client.subscribe(request.get("subscribe", []), request.get("unsubscribe", []))
+        except ValueError as e:
+            return self.reject(cmd, str(e))
+        # New value subscribers get the current values, not only later changes
+        modules = [topic.partition(":")[2] for topic in request.get("subscribe", []) if topic.partition(":")[0] == Topics.VAL]
+        if modules:
+            self.ctx.resendValues(cmd.client, None if "" in modules else modules)
+        topics = cmd.client.subscriptions()
+        if cmd.id is not None:
+            cmd.accepted()
+            cmd.done(topics)
+            return None
+        return json.dumps({"type":MsgTypes.MSG.value, "status": "success", "data": topics})
+
+    def handle_setting(self, cmd):
+        try:
+            result = self.ctx.setting(cmd)
+        except Exception as e:
+            return self.reject(cmd, str(e) or repr(e))
+        if cmd.id is not None:
+            cmd.accepted()
+            cmd.done(result)
+            return None
+        return json.dumps({"type":MsgTypes.MSG.value, "status": "success", "data": "Received"})
+
+    def handle_credits(self, cmd):
+        try:
+            credits = cmd.client.grant(cmd.data.get("data"))
+        except ValueError as e:
+            return self.reject(cmd, str(e))
+        if cmd.id is not None:
+            cmd.accepted()
+            cmd.done(credits)
+        # Credits are replenished per rendered frame, do not flood the client with acks
+        return None
@@ -0,0 +1,79 @@
+''' Packing of 12 bit pixel data, shared by the server and the client library.
+
+Two pixels a, b are stored little-endian in three bytes:
+    byte 0: a bits 0-7
+    byte 1: a bits 8-11 in the low nibble, b bits 0-3 in the high nibble
+    byte 2: b bits 4-11
+An odd pixel count is padded with one zero pixel.
+Only depends on numpy and zlib so it can be copied as is.
+'''
+import zlib
+import numpy as np
+
+MASK = 0x0FFF
+
+def packedSize(count):
+    ''' Number of bytes holding count packed pixels. '''
+    return (count + 1) // 2 * 3
+
+def checkRange(data):
+    ''' Raise ValueError if any value is outside 0..4095, returns data as array. '''
+    data = np.asarray(data)
+    if data.size and (data.max() > MASK or (data.dtype.kind != "u" and data.min() < 0)):
+        raise ValueError(f"Values must be in 0..{MASK} to be packed to 12 bits")
+    return data
+
+def pack12(data):
+    ''' Pack an integer array with values below 4096 to bytes, 1.5 bytes per pixel.
+
+    Values outside 0..4095 raise ValueError instead of being truncated.
+    '''
+    data = checkRange(data)
+    flat = np.ascontiguousarray(data, dtype=np.uint16).ravel()
+    if flat.size % 2:
+        flat = np.append(flat, np.uint16(0))
+    a = flat[0::2]
+    b = flat[1::2]
+    out = np.empty((a.size, 3), np.uint8)
+    # Assignment to uint8 keeps the low byte
+    out[:, 0] = a & 0xFF
+    out[:, 1] = ((a >> 8) & 0x0F) | ((b & 0x0F) << 4)
+    out[:, 2] = (b >> 4) & 0xFF
+    return out.tobytes()
+
+def unpack12(buffer, count):
+    ''' Unpack count pixels from packed bytes to a flat uint16 array. '''
+    raw = np.frombuffer(buffer, np.uint8, count=packedSize(count)).reshape(-1, 3).astype(np.uint16)
+    out = np.empty(raw.shape[0] * 2, np.uint16)
+    out[0::2] = raw[:, 0] | ((raw[:, 1] & 0x0F) << 8)
+    out[1::2] = (raw[:, 1] >> 4) | (raw[:, 2] << 4)
+    return out[:count]
+
+def deltaRows(data):
+    ''' Difference of every row to the previous one, modulo 4096. '''
+    delta = np.array(data, dtype=np.uint16)
+    delta[1:] -= data[:-1].astype(np.uint16)
+    delta &= MASK
+    return delta
+
+def undeltaRows(delta):
+    ''' Inverse of deltaRows. 4096 divides 65536, so the uint16 wrap is harmless. '''
+    return np.cumsum(delta, axis=0, dtype=np.uint16) & MASK
+
+def encode12(data, compress=False, level=1):
+    ''' 2D array to packed bytes, optionally row-delta coded and deflated.
+
+    Values outside 0..4095 raise ValueError, also before the modulo of the delta.
+    '''
+    if not compress:
+        return pack12(data)
+    data = checkRange(data)
+    return zlib.compress(pack12(deltaRows(data)), level)
+
+def decode12(payload, shape, compress=False):
+    ''' Packed bytes back to a uint16 array of shape (rows, columns). '''
+    rows, columns = shape
+    if compress:
+        payload = zlib.decompress(payload)
+    data = unpack12(payload, rows * columns).reshape(rows, columns)
+    return undeltaRows(data) if compress else data
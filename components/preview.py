@@ -0,0 +1,225 @@
+import cv2
+import threading
+import time
+import numpy as np
+from components.frames import ImageFrame, StatsFrame, Codecs, DTypes
+from components.pack12 import encode12
+
+# Encoders available on this server with their default parameter
+CODECS = {}
+# Inclusive range of the parameter, for codecs that take one
+CODEC_RANGES = {}
+
+def registerCodec(codec, default=None, limits=None):
+    ''' Register encoder(img, param) -> bytes for codec. '''
+    def register(encoder):
+        CODECS[codec] = (encoder, default)
+        if limits:
+            CODEC_RANGES[codec] = limits
+        return encoder
+    return register
+
+def imencode(ext, img, params):
+    ok, buffer = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"Encoding {ext} failed")
+    return buffer.tobytes()
+
+@registerCodec(Codecs.RAW)
+def encodeRaw(img, param):
+    return np.ascontiguousarray(img).tobytes()
+
+@registerCodec(Codecs.PNG, default=1, limits=(0, 9))
+def encodePng(img, level):
+    # Level 0-9, low levels are much faster for little size difference
+    return imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, int(level)])
+
+@registerCodec(Codecs.JPEG, default=85, limits=(0, 100))
+def encodeJpeg(img, quality):
+    return imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+
+# OpenCV might be built without WebP
+if cv2.haveImageWriter(".webp"):
+    @registerCodec(Codecs.WEBP)
+    def encodeWebp(img, param):
+        # Quality above 100 selects lossless compression
+        return imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, 101])
+
+class EncodeStats:
+    ''' Encode time and size per codec, to choose sensibly for the network.
+
+    encode_ms is the codec alone, pipeline_ms the whole preview of a frame:
+    crop, resize, lookup table and codec, plus the round trip to the encoder
+    process if used.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, codec, encodeSeconds, pipelineSeconds, size):
+        with self.lock:
+            count, encode, pipeline, nbytes = self.entries.get(codec, (0, 0.0, 0.0, 0))
+            self.entries[codec] = (count + 1, encode + encodeSeconds, pipeline + pipelineSeconds, nbytes + size)
+
+    def report(self):
+        with self.lock:
+            return {
+                codec.name: {"count": count, "encode_ms": 1000.0 * encode / count,
+                             "pipeline_ms": 1000.0 * pipeline / count, "bytes": nbytes // count}
+                for codec, (count, encode, pipeline, nbytes) in self.entries.items()
+            }
+
+def negotiateCodec(accepted):
+    ''' Pick the first codec the client accepts that this server supports.
+
+    accepted is a list in client preference order of codec names or objects
+    like {"codec": "JPEG", "quality": 80} or {"codec": "PNG", "level": 1}.
+    Returns (codec, param), RAW if nothing matches. The parameter is clamped
+    to the codec's range, anything that is not a number raises ValueError.
+    '''
+    if isinstance(accepted, (str, dict)):
+        accepted = [accepted]
+    if not isinstance(accepted, list):
+        raise ValueError("Codecs must be a list of codec names or objects")
+    for entry in accepted:
+        if isinstance(entry, str):
+            entry = {"codec": entry}
+        if not isinstance(entry, dict):
+            raise ValueError(f"Invalid codec entry: {entry!r}")
+        try:
+            codec = Codecs[str(entry.get("codec")).upper()]
+        except KeyError:
+            continue
+        if codec not in CODECS:
+            continue
+        return (codec, codecParam(codec, entry.get("quality", entry.get("level"))))
+    return (Codecs.RAW, None)
+
+def codecParam(codec, value):
+    ''' Validate a client supplied codec parameter, None selects the default. '''
+    limits = CODEC_RANGES.get(codec)
+    if limits is None:
+        # The codec takes no parameter
+        return CODECS[codec][1]
+    if value is None:
+        return CODECS[codec][1]
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid {codec.name} parameter: {value!r}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {codec.name} parameter: {value!r}") from None
+    if not np.isfinite(number):
+        raise ValueError(f"Invalid {codec.name} parameter: {value!r}")
+    low, high = limits
+    return int(min(max(round(number), low), high))
+
+def histogram(data, levels):
+    ''' Counts of the values 0..levels-1 and the number of values above.
+
+    calcHist reads uint8 and uint16 frames directly, bincount would first
+    copy the frame to 8 byte indices.
+    '''
+    hist = cv2.calcHist([data], [0], None, [levels], [0, levels]).ravel().astype(np.int64)
+    return hist, int(data.size) - int(hist.sum())
+
+def previewLUT(data, low=0.1, high=99.9, bits=12):
+    ''' Build a uint8 lookup table stretching the low..high percentiles of the frame. '''
+    hist, _ = histogram(data, 1 << bits)
+    cdf = np.cumsum(hist)
+    # Levels at which the cumulative histogram crosses the percentiles
+    lo = int(np.searchsorted(cdf, cdf[-1] * low / 100.0))
+    hi = int(np.searchsorted(cdf, cdf[-1] * high / 100.0))
+    hi = max(hi, lo + 1)
+    # Cover the whole dtype, so the table also maps later frames with higher values
+    levels = np.arange(max(len(hist), np.iinfo(data.dtype).max + 1), dtype=np.int64)
+    return np.clip((levels - lo) * 255 // (hi - lo), 0, 255).astype(np.uint8)
+
+def toPreview(data, low=0.1, high=99.9):
+    ''' Convert a raw camera frame to an 8 bit image with percentile contrast. '''
+    if data.dtype in (np.uint8, np.uint16):
+        # Single pass through the table, indexing casts the pixels in buffered chunks
+        return previewLUT(data, low, high)[data]
+    # Fallback for anything that cannot index a table
+    img = data.astype(np.float32)
+    img = cv2.normalize(img, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
+    return img.astype(np.uint8)
+
+def frameStats(data, seq, timestamp, bits=12):
+    ''' Histogram, min, max, mean and saturated pixel count without full-size temporaries. '''
+    levels = 1 << bits
+    hist, above = histogram(data, levels)
+    pixels = int(data.size)
+    mean = float(cv2.mean(data)[0]) if pixels else 0.0
+    nonzero = np.flatnonzero(hist)
+    if above:
+        minimum, maximum = int(data.min()), int(data.max())
+    else:
+        minimum, maximum = (int(nonzero[0]), int(nonzero[-1])) if len(nonzero) else (0, 0)
+    # Anything above the nominal range counts as saturated
+    saturated = int(hist[-1]) + above
+    hist[-1] = saturated
+    return StatsFrame(seq, timestamp, bits, minimum, maximum, mean, saturated, pixels, hist.astype(np.uint32))
+
+def fitView(shape, viewport=None):
+    ''' Clamp a viewport (x, y, w, h, width, height) to the frame.
+
+    The region is decimated to fit into width x height keeping its aspect
+    ratio, it is never upscaled. Without a viewport the whole frame is shown
+    at half resolution.
+    '''
+    rows, cols = shape
+    if viewport is None:
+        return (0, 0, cols, rows, max(1, cols // 2), max(1, rows // 2))
+    x, y, w, h, width, height = (int(v) for v in viewport)
+    x = min(max(x, 0), cols - 1)
+    y = min(max(y, 0), rows - 1)
+    w = min(max(w, 1), cols - x)
+    h = min(max(h, 1), rows - y)
+    scale = min(width / w, height / h, 1.0)
+    return (x, y, w, h, max(1, round(w * scale)), max(1, round(h * scale)))
+
+def cropView(data, view):
+    ''' Crop and decimate a raw frame to view, keeping its values. '''
+    x, y, w, h, width, height = view
+    img = data[y:y + h, x:x + w]
+    # Area averaging keeps the values in range
+    if (width, height) != (w, h):
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    return img
+
+def renderPreview(data, view, contrast=(0.1, 99.9)):
+    ''' Crop and decimate a raw frame to view and convert it to 8 bit. '''
+    # The conversion only sees the small image
+    return toPreview(cropView(data, view), *contrast)
+
+def encodePreview(data, seq, timestamp, view, codec, contrast=(0.1, 99.9)):
+    ''' Render a raw frame to view and pack it as a binary frame.
+
+    codec is a (Codecs, parameter) pair as returned by negotiateCodec.
+    '''
+    return encodePreviewTimed(data, seq, timestamp, view, codec, contrast)[0]
+
+def encodePreviewTimed(data, seq, timestamp, view, codec, contrast=(0.1, 99.9)):
+    ''' Like encodePreview, returns (frame, seconds) with the time of the codec alone. '''
+    codec, param = codec
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported preview codec: {codec}")
+    x, y, w, h, width, height = view
+    img = renderPreview(data, view, contrast)
+    encoder, _ = CODECS[codec]
+    start = time.perf_counter()
+    payload = encoder(img, param)
+    seconds = time.perf_counter() - start
+    return ImageFrame(seq, width, height, DTypes.UINT8, codec, timestamp, payload, roi=(x, y, w, h)).pack(), seconds
+
+def encodeFullDepth(data, seq, timestamp, view, compress=False):
+    ''' Crop and decimate a raw frame to view keeping its 12 bit values.
+
+    The pixels are packed at 1.5 bytes each, with compress they are row-delta
+    coded and deflated as well.
+    '''
+    x, y, w, h, width, height = view
+    img = cropView(data, view)
+    codec = Codecs.ZLIB if compress else Codecs.RAW
+    return ImageFrame(seq, width, height, DTypes.UINT12, codec, timestamp, encode12(img, compress), roi=(x, y, w, h)).pack()
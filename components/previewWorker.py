@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+
+class PreviewWorker(threading.Thread):
+    ''' Processes camera frames off the capture thread.
+
+    The capture callback only drops the frame into a one-slot mailbox. If the
+    worker is still busy, a newer frame supersedes the waiting one, so the
+    capture rate never depends on the preview processing cost.
+    Frames submitted with keep (snapshots) are queued instead, never
+    superseded, and processed ahead of the latest frame.
+    Frames that were processed or superseded are handed to release.
+    '''
+    def __init__(self, callback, release=None):
+        super().__init__(daemon=True)
+        self.callback = callback
+        self.release = release
+
+        self.lock = threading.Lock()
+        self.frame = None
+        self.kept = deque()
+        self.wakeup = threading.Event()
+        self.stopThreads = False
+
+        # Counters exposed through stats()
+        self.submitted = 0
+        self.processed = 0
+        self.superseded = 0
+
+    def submit(self, data, *args, keep=False):
+        ''' Called from the capture thread, never blocks on processing.
+        args are passed on to the callback along with the frame. '''
+        superseded = None
+        with self.lock:
+            if keep:
+                self.kept.append((data, args))
+            else:
+                superseded, self.frame = self.frame, (data, args)
+                if superseded is not None:
+                    self.superseded += 1
+            self.submitted += 1
+        self.wakeup.set()
+        if superseded is not None and self.release:
+            self.release(superseded[0])
+
+    def stop(self):
+        self.stopThreads = True
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopThreads:
+            self.wakeup.wait()
+            with self.lock:
+                if self.kept:
+                    frame = self.kept.popleft()
+                else:
+                    frame, self.frame = self.frame, None
+                # Stay awake while anything is left
+                if not self.kept and self.frame is None:
+                    self.wakeup.clear()
+            if frame is None:
+                continue
+            data, args = frame
+            try:
+                self.callback(data, *args)
+            except Exception as e:
+                print(f"Preview processing failed: {e!r}")
+            finally:
+                if self.release:
+                    self.release(data)
+            self.processed += 1
+
+    def stats(self):
+        with self.lock:
+            return {"submitted": self.submitted, "processed": self.processed, "superseded": self.superseded, "queued": len(self.kept)}
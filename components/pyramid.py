@@ -0,0 +1,98 @@
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from components.frames import ImageFrame, Codecs, DTypes
+from components.preview import CODECS, previewLUT, toPreview
+from components.pack12 import encode12
+
+class Pyramid:
+    ''' A snapshot at full resolution and successive 2x area-downsampled levels.
+
+    Level 0 is the full frame, the last level fits into a single tile. Tiles
+    of every level share one contrast table, computed from the full frame, so
+    they fit together without seams.
+    '''
+    def __init__(self, data, seq, timestamp, contrast=(0.1, 99.9), tileSize=256):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.tileSize = tileSize
+        # Own copy, the camera frame goes back to its pool
+        self.levels = [np.array(data)]
+        while max(self.levels[-1].shape) > tileSize:
+            rows, cols = self.levels[-1].shape
+            self.levels.append(cv2.resize(self.levels[-1], ((cols + 1) // 2, (rows + 1) // 2), interpolation=cv2.INTER_AREA))
+        self.lut = previewLUT(data, *contrast) if data.dtype in (np.uint8, np.uint16) else None
+        self.contrast = contrast
+
+        self.lock = threading.Lock()
+        self.encoded = {}
+
+    def grid(self, level):
+        ''' Number of tile columns and rows of a level. '''
+        rows, cols = self.levels[level].shape
+        return -(-cols // self.tileSize), -(-rows // self.tileSize)
+
+    def info(self):
+        rows, cols = self.levels[0].shape
+        return {"seq": self.seq, "width": cols, "height": rows, "tileSize": self.tileSize,
+                "levels": [list(self.grid(level)) for level in range(len(self.levels))]}
+
+    def tile(self, level, column, row, codec, fullDepth=None):
+        ''' Binary IMG frame of one tile, its roi is the region on the full frame.
+
+        codec is the client's preview (Codecs, parameter) pair, fullDepth
+        sends the 12 bit values instead, see ImageFrame.
+        '''
+        if not 0 <= level < len(self.levels):
+            raise ValueError(f"No pyramid level {level}")
+        columns, rows = self.grid(level)
+        if not (0 <= column < columns and 0 <= row < rows):
+            raise ValueError(f"No tile {column}, {row} on level {level}")
+        key = (level, column, row, fullDepth or codec)
+        with self.lock:
+            if key in self.encoded:
+                return self.encoded[key]
+
+        x, y = column * self.tileSize, row * self.tileSize
+        img = self.levels[level][y:y + self.tileSize, x:x + self.tileSize]
+        height, width = img.shape
+        if fullDepth:
+            payload = encode12(img, fullDepth == Codecs.ZLIB)
+            dtype, codec = DTypes.UINT12, fullDepth
+        else:
+            codec, param = codec
+            encoder, _ = CODECS[codec]
+            img = self.lut[img] if self.lut is not None else toPreview(img, *self.contrast)
+            payload = encoder(img, param)
+            dtype = DTypes.UINT8
+        # Region on level 0, clipped at the frame edges
+        scale = 1 << level
+        full = self.levels[0].shape
+        roi = (x * scale, y * scale, min(width * scale, full[1] - x * scale), min(height * scale, full[0] - y * scale))
+        data = ImageFrame(self.seq, width, height, dtype, codec, self.timestamp, payload, roi=roi).pack()
+        with self.lock:
+            self.encoded[key] = data
+        return data
+
+
+class PyramidCache:
+    ''' Pyramids per snapshot sequence, the least recently used ones are dropped. '''
+    def __init__(self, maxEntries=4):
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.pyramids = OrderedDict()
+
+    def add(self, pyramid):
+        with self.lock:
+            self.pyramids[pyramid.seq] = pyramid
+            while len(self.pyramids) > self.maxEntries:
+                self.pyramids.popitem(last=False)
+
+    def get(self, seq):
+        with self.lock:
+            pyramid = self.pyramids.pop(seq, None)
+            if pyramid is None:
+                raise ValueError(f"Snapshot {seq} is no longer available")
+            self.pyramids[seq] = pyramid
+            return pyramid
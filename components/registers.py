@@ -0,0 +1,58 @@
+class ShadowRegister:
+    ''' Cached value of a device feature.
+
+    Reads are served from the cache, the device is only read again after
+    invalidate(). Writes go through to the device only when the value
+    changes, optionally reading it back to verify. Until a device is attached
+    the register just holds the value.
+    '''
+    def __init__(self, value=None, tolerance=1e-9):
+        self.value = value
+        self.valid = value is not None
+        self.tolerance = tolerance
+        self.read = None
+        self.write = None
+
+        # Device accesses, exposed through stats()
+        self.reads = 0
+        self.writes = 0
+
+    def attach(self, read, write):
+        self.read = read
+        self.write = write
+
+    def invalidate(self):
+        self.valid = False
+
+    def same(self, a, b):
+        # Relative tolerance, the device rounds floats to its increments
+        if a is None or b is None:
+            return a is b
+        return a == b or abs(a - b) <= self.tolerance * max(abs(a), abs(b))
+
+    def get(self):
+        if not self.valid and self.read:
+            self.value = self.read()
+            self.reads += 1
+        self.valid = True
+        return self.value
+
+    def set(self, value, force=False, verify=False):
+        ''' Write value if it differs from the cached one. Returns True if written. '''
+        if not force and self.valid and self.same(self.value, value):
+            return False
+        if self.write:
+            self.write(value)
+            self.writes += 1
+        self.value = value
+        self.valid = True
+        if verify and self.read:
+            actual = self.read()
+            self.reads += 1
+            if not self.same(actual, value):
+                print("...Device reads back {} after writing {}".format(actual, value))
+            self.value = actual
+        return True
+
+    def stats(self):
+        return {"value": self.value, "reads": self.reads, "writes": self.writes}
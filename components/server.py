@@ -1,20 +1,45 @@
 import websockets
 import threading
 from websockets.sync.server import serve
+from components.client import Client
+from components.serverBase import ServerBase
 
-class WebSocketServer(threading.Thread):
+class ThreadedClient(Client, threading.Thread):
+    ''' Client with its own sender thread, slow sockets only block themselves. '''
+    def __init__(self, websocket, addr, maxControl=1000):
+        Client.__init__(self, websocket, addr, maxControl)
+        threading.Thread.__init__(self, daemon=True)
+        self.wakeup = threading.Event()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def close(self):
+        # The sender thread closes the socket, never block the caller here
+        with self.lock:
+            self.closed = True
+        self.wakeup.set()
+
+    def run(self):
+        try:
+            while not self.closed:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                # Drain everything queued since the last wake-up
+                while not self.closed and (data := self.pop()) is not None:
+                    self.websocket.send(data)
+                    self.sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            with self.lock:
+                self.closed = True
+            self.websocket.close()
+
+class WebSocketServer(ServerBase):
     def __init__(self, ctx, host="localhost", port=1234, password="", handler=None, ssl_context=None):
-        super().__init__()
-        self.host = host
-        self.port = port
-        self.password = password
-        self.handler = handler
-        self.ssl_context = ssl_context
+        super().__init__(ctx, host, port, password, handler, ssl_context)
         self.server = None
-        self.connections = set()
-        # Context binding
-        self.ctx = ctx
-        self.ctx.server = self
 
     def run(self):
         self.server = serve(self.handle_client, self.host, self.port, ssl_context=self.ssl_context, max_size=10**7)
@@ -23,44 +48,43 @@ class WebSocketServer(threading.Thread):
 
     def stop(self):
         self.server.shutdown()
-    
-    def broadcast(self, data):
-        # Iterate through available clients and send the data
-        for socket in self.connections:
-            socket.send(data)
-    
+
     def authenticate(self, ws, addr):
         # Receive the password from the client
         password = ws.recv()
         if password == self.password:
             print(f"[{addr[0]}] Authentication successful.")
             ws.send("Authenticated")
-            # Add client to the set
-            self.connections.add(ws)
-            # Return True for successful authentication
-            return True
+            # Add client with its own sender to the set
+            client = ThreadedClient(ws, addr[0])
+            client.start()
+            self._addClient(client)
+            # Return the client for successful authentication
+            return client
         else:
             print(f"[{addr[0]}] Authentication failed.")
             # Authentication failed, close the connection
             ws.close(code=1008, reason="Authentication failed")
-            # Return False on failed authentication
-            return False
+            # Return None on failed authentication
+            return None
 
 
     def handle_client(self, websocket):
         ip = websocket.remote_address
         print(f"[{ip[0]}] Client connected.")
         # Compare the received password with the expected password
-        if self.authenticate(websocket, ip):
+        client = self.authenticate(websocket, ip)
+        if client:
             # Listen for messages!
             try:
                 while True:
                     message = websocket.recv()
                     if not message:
                         break
-                    # Process using the handler and send response
-                    response = self.handler.handle_request(message, ip[0])
-                    websocket.send(response)
+                    # Process using the handler and queue the response
+                    response = self.handler.handle_request(message, client)
+                    if response:
+                        client.enqueue(response)
             # Notify abrupt connection drop
             except websockets.exceptions.ConnectionClosedError:
                 print(f"[{ip[0]}] Connection stopping abnormally!")
@@ -69,5 +93,4 @@ class WebSocketServer(threading.Thread):
             # Notify connection stop
             finally:
                 print(f"[{ip[0]}] Connection closed.")
-                # remove client from the set
-                self.connections.remove(websocket)
\ No newline at end of file
+                self._removeClient(client)
@@ -0,0 +1,65 @@
+import threading
+from components.handler import Topics
+
+class ServerBase(threading.Thread):
+    ''' Client bookkeeping and fan-out shared by the servers, independent of the transport.
+
+    Servers implement run() and stop() and register authenticated clients
+    with _addClient() and _removeClient().
+    '''
+    def __init__(self, ctx, host="localhost", port=1234, password="", handler=None, ssl_context=None):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.password = password
+        self.handler = handler
+        self.ssl_context = ssl_context
+        self.connections = set()
+        self.lock = threading.Lock()
+        # Context binding
+        self.ctx = ctx
+        self.ctx.server = self
+
+    def _addClient(self, client):
+        with self.lock:
+            self.connections.add(client)
+        # The current state was possibly sent before this client listened
+        self.ctx.resendValues(client)
+
+    def _removeClient(self, client):
+        # Remove client from the set and stop its sender
+        with self.lock:
+            self.connections.discard(client)
+        client.close()
+
+    def clients(self):
+        # Copy, so connects and disconnects do not change the set while iterating
+        with self.lock:
+            return list(self.connections)
+
+    def broadcast(self, data, droppable=False, topic=None):
+        # Hand the data to every subscribed client queue, never blocks on a socket
+        for client in self.clients():
+            if client.subscribed(topic):
+                client.enqueue(data, droppable, slot=topic)
+
+    def broadcastEncoded(self, encoder, droppable=True, topic=None, tag=None):
+        # Encoder produces the data for each client, e.g. in its preview format
+        for client in self.clients():
+            # Without credits the client gets no live images, so do not even encode
+            if client.subscribed(topic) and (topic != Topics.IMG or not droppable or client.wantsFrames()):
+                try:
+                    data = encoder(client)
+                except Exception as e:
+                    # One client's settings must not keep the others from their data
+                    print(f"[{client.addr}] Encoding failed: {e!r}")
+                    continue
+                if data is not None:
+                    client.enqueue(data, droppable, tag, slot=topic)
+
+    def hasSubscribers(self, topic, frames=False):
+        # With frames, only count clients that have credits left
+        return any(client.subscribed(topic) and (not frames or client.wantsFrames()) for client in self.clients())
+
+    def stats(self):
+        return [client.stats() for client in self.clients()]
@@ -0,0 +1,148 @@
+import threading
+import time
+import numpy as np
+from components.cameraBase import CameraBase
+
+class SimulatedCamera(CameraBase):
+    ''' Camera without hardware, for benchmarks and tests of the image path.
+
+    Frames are synthesised and delivered on the camera's own thread like the
+    SDK does: free running at frameRate in LIVE mode, exposure plus readout
+    time after each software trigger otherwise. The signal scales with
+    exposure and gain and saturates at the bit depth. The pattern moves by one
+    column per frame, so consecutive frames differ.
+    '''
+    PATTERNS = ("gradient", "bars", "flat")
+
+    def __init__(self, live_callback, snapshot_callback, acquire_callback, maxFPS = 10.0, exposureCallback=None, gainCallback=None, ringFrames=0,
+                 width=2448, height=2048, bits=12, pattern="gradient", readout=0.02, noise=20.0):
+        super().__init__(live_callback, snapshot_callback, acquire_callback, maxFPS, exposureCallback, gainCallback, ringFrames)
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown pattern '{pattern}'. Allowed values are {', '.join(self.PATTERNS)}.")
+        # Full depth streaming packs 12 bits, statistics follow self.bits
+        if not 1 <= bits <= 12:
+            raise ValueError(f"Unsupported bit depth {bits}, at most 12 bits are supported.")
+        self.width = width
+        self.height = height
+        self.bits = bits
+        self.pattern = pattern
+        # Seconds from the end of the exposure to the delivery of the frame
+        self.readout = readout
+
+        self.frameId = 0
+        self.thread = None
+        self.stopThreads = False
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__triggers = 0
+        self.__triggered = True
+
+        # Pattern wider than the frame so it can move, noise taller so it can change
+        self.__period = 256
+        self.__maxLevel = (1 << bits) - 1
+        self.__base = self.__makePattern()
+        self.__noise = np.random.default_rng(0).normal(0.0, noise, (height + 8, width)).astype(np.float32)
+        self.__scratch = np.empty((height, width), np.float32)
+
+        print("Simulated camera {}x{} {} bit".format(width, height, bits))
+        self.connected = True
+        self._allocateBuffers((height, width), np.uint8 if bits <= 8 else np.uint16)
+        self.mode = self.CameraModes.SNAPSHOT
+        self._startStream()
+
+    def stop(self):
+        if self.connected:
+            self._stopStream()
+            self.connected = False
+
+    def __makePattern(self):
+        # Values between 0 and 1
+        y = np.arange(self.height, dtype=np.float32)[:, None]
+        x = np.arange(self.width + self.__period, dtype=np.float32)[None, :]
+        if self.pattern == "gradient":
+            return ((x + y) % self.__period) / self.__period
+        if self.pattern == "bars":
+            # Contrast of the bars rises towards the bottom, like a focus target
+            return 0.5 + 0.5 * np.cos(2 * np.pi * x / 32) * (y / self.height)
+        return np.full((self.height, self.width + self.__period), 0.5, np.float32)
+
+    def __deliver(self):
+        # A failing callback must not end the capture thread, the SDK keeps delivering as well
+        try:
+            self.__synthesise()
+        except Exception as e:
+            print("...Frame {} not delivered: {!r}".format(self.frameId, e))
+
+    def __synthesise(self):
+        self.frameId += 1
+        # Full scale at 100 ms and unity gain would be 80% of the range
+        scale = 0.8 * self.__maxLevel * self.exposure / 100.0 * self.gain
+        offset = self.frameId % self.__period
+        np.multiply(self.__base[:, offset:offset + self.width], scale, out=self.__scratch)
+        shift = self.frameId % 8
+        np.add(self.__scratch, self.__noise[shift:shift + self.height], out=self.__scratch)
+        np.clip(self.__scratch, 0, self.__maxLevel, out=self.__scratch)
+        data = self.pool.acquire()
+        if data is None:
+            data = np.empty((self.height, self.width), self.pool.dtype)
+        np.copyto(data, self.__scratch, casting="unsafe")
+        self._route(data, self.frameId, time.monotonic_ns())
+
+    def __run(self):
+        nextFrame = time.monotonic() + self.exposure / 1000.0 + self.readout
+        while not self.stopThreads:
+            if self.__triggered:
+                with self.__lock:
+                    triggered = self.__triggers > 0
+                    if triggered:
+                        self.__triggers -= 1
+                    else:
+                        self.__wakeup.clear()
+                if not triggered:
+                    self.__wakeup.wait()
+                    continue
+                # A burst answers a single trigger with all its frames
+                for _ in range(self.burst if self._burstHardware else 1):
+                    time.sleep(self.exposure / 1000.0 + self.readout)
+                    self.__deliver()
+                nextFrame = time.monotonic() + self.exposure / 1000.0 + self.readout
+            else:
+                # Free running, the frame rate is already limited by the exposure
+                nextFrame = max(nextFrame + 1.0 / self.frameRate, time.monotonic())
+                if self.__wakeup.wait(nextFrame - time.monotonic()):
+                    # Mode change or stop
+                    self.__wakeup.clear()
+                    nextFrame = time.monotonic() + self.exposure / 1000.0 + self.readout
+                    continue
+                self.__deliver()
+
+    def _configureTrigger(self, mode):
+        self.__triggered = mode != self.CameraModes.LIVE
+        if mode == self.CameraModes.LIVE:
+            self.frameRate = self.maxFPS
+        self.__wakeup.set()
+
+    def _configureBurst(self, frames):
+        return True
+
+    def _clock(self):
+        return time.monotonic_ns()
+
+    def _softwareTrigger(self):
+        with self.__lock:
+            self.__triggers += 1
+        self.__wakeup.set()
+
+    def _startStream(self):
+        if self.ring:
+            self.ring.restart()
+        self.stopThreads = False
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def _stopStream(self):
+        if self.thread:
+            self.stopThreads = True
+            self.__wakeup.set()
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,147 @@
+from components.kurios import Status
+from components.polarization import PolController, ThorlabsELL9, ThorlabsELL14
+
+class SimulatedKDC:
+    ''' Focus stage without hardware, moves complete immediately. '''
+    def __init__(self, positionCallback=None):
+        self.connected = True
+
+        self.minorStep = 0.1
+        self.majorStep = 1.0
+        self.jogStep = 0.01
+
+        self._position = 0.0
+        self.positionCallback = positionCallback
+
+        self.home()
+
+    def stop(self):
+        self.connected = False
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        # In mm, the real stage reports encoder steps
+        self._position = float(value)
+        print("Position is now: {}".format(self._position))
+        if self.positionCallback:
+            self.positionCallback(self._position)
+
+    def home(self):
+        self.position = 0.0
+
+    def move_to_position(self, position):
+        '''Move to aboslute position in mm'''
+        self.position = position
+
+    def move_relative(self, distance):
+        '''Move ralitve distance in mm'''
+        self.position = self._position + distance
+
+    def step_major(self, direction):
+        if direction in (1, -1):
+            self.move_relative(direction * self.majorStep)
+        else:
+            print("Error moving major!")
+
+    def step_minor(self, direction):
+        if direction in (1, -1):
+            self.move_relative(direction * self.minorStep)
+        else:
+            print("Error moving minor!")
+
+    def step_jog(self, direction):
+        if direction in (1, -1):
+            self.move_relative(direction * self.jogStep)
+        else:
+            print("Error moving jog!")
+
+class SimulatedELL:
+    ''' Answers the ELLx bus commands like the mounts do, positions in encoder units. '''
+    def __init__(self):
+        self.connected = True
+        self.positions = {}
+        self.jogSteps = {}
+
+    def stop(self):
+        self.connected = False
+
+    def sendCommand(self, msg):
+        channel, command, value = msg[0:1], msg[1:3], msg[3:]
+        position = self.positions.get(channel, 0)
+        if command == "ma":
+            position = self.decode(value)
+        elif command == "ho":
+            position = 0
+        elif command in ("fw", "bw"):
+            position += self.jogSteps.get(channel, 0) * (1 if command == "fw" else -1)
+        elif command == "sj":
+            self.jogSteps[channel] = self.decode(value)
+        if command in ("sj", "gj"):
+            return "{}GJ{}\r\n".format(channel, self.encode(self.jogSteps.get(channel, 0)))
+        self.positions[channel] = position
+        return "{}PO{}\r\n".format(channel, self.encode(position))
+
+    def decode(self, hex_str):
+        num = int(hex_str, 16)
+        return num - 0x100000000 if num >= 0x80000000 else num
+
+    def encode(self, num):
+        return format(num + 0x100000000 if num < 0 else num, '08X')
+
+class SimulatedPolController(PolController):
+    ''' Polarizer mounts on a simulated bus, the mount classes are the real ones. '''
+    def __init__(self, rot1callback=None, rot2callback=None, flt1callback=None):
+        self.port = None
+        self.connection = SimulatedELL()
+        self.rot1 = ThorlabsELL14(self.connection, 1, rot1callback)
+        self.rot2 = ThorlabsELL14(self.connection, 2, rot2callback)
+        self.flt1 = ThorlabsELL9(self.connection, 3, flt1callback)
+
+class SimulatedKurios:
+    ''' Tunable filter without hardware, always ready. '''
+    def __init__(self, lctfCallback=None, WLmin=420.0, WLmax=730.0):
+        self.connected = True
+        self.WLmin = WLmin
+        self.WLmax = WLmax
+        self.status = Status.REDY
+        self.temperature = 37.0
+
+        self.__black = False
+        self.__wl = WLmin
+
+        self.lctfCallback = lctfCallback
+
+    def stop(self):
+        self.connected = False
+
+    @property
+    def black(self):
+        return self.__black
+
+    @black.setter
+    def black(self, value):
+        if isinstance(value, bool):
+            self.__black = value
+            self.report()
+        else:
+            print("ERROR: wrong black type for KURIOS. Should be bool!")
+
+    @property
+    def wl(self):
+        return self.__wl
+
+    @wl.setter
+    def wl(self, value):
+        if value > self.WLmin and value < self.WLmax:
+            self.__wl = float(value)
+            self.report()
+        else:
+            print("ERROR: KURIOS wavelength out of range")
+
+    def report(self):
+        if self.lctfCallback:
+            self.lctfCallback(self.wl, self.black, f"{self.status.name}", self.temperature, self.WLmin, self.WLmax)
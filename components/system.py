@@ -1,97 +1,283 @@
 import json
-import numpy as np
-from components.handler import MsgTypes
-from components.camera import GetCamerasCamera
+import os
+from components.handler import MsgTypes, Topics
+from components.frames import Codecs
 from components.focus import ThorlabsKDC
 from components.polarization import PolController
 from components.kurios import Kurios
 from components.acquisitionParser import AcquisitionFileParser
 from components.acquisitionRunner import AcquisitionRunner
+from components.frameCache import FrameCache
+from components.preview import fitView, cropView, encodePreviewTimed, encodeFullDepth, negotiateCodec, frameStats, EncodeStats
+from components.tiles import TileStreams
+from components.pyramid import Pyramid, PyramidCache
+from components.previewWorker import PreviewWorker
+from components.encoderProcess import EncoderProcess
+from components.valAggregator import ValAggregator
 import pickle
-import base64
-from PIL import Image
-import io
-import cv2
+import itertools
+import time
 
 class System:
-    def __init__(self, ctx):
+    # cam fields that only change how frames are prepared, applied as they arrive
+    SETTINGS = ("PreviewContrast", "Viewport", "Codecs", "FullDepth", "Tiles")
+
+    def __init__(self, ctx, valWindow=0.02, encoderProcess=False, simulatedCamera=None, ringFrames=0):
         # Context binding
         self.ctx = ctx
         self.ctx.system = self
-        self.cam = GetCamerasCamera(self.image_send_callback, self.image_send_callback, self.image_acquire_callback, exposureCallback=self.sendExposure, gainCallback=self.sendGain)
-        # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
-        #SUBSYSTEM=="tty", ATTRS{manufacturer}=="Thorlabs", ATTRS{serial}=="1234", SYMLINK+="kdc1001"
-        self.focus = ThorlabsKDC(port="/dev/kdc1001", positionCallback=self.sendPosition)
-        # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
-        #SUBSYSTEM=="tty", ATTRS{manufacturer}=="FTDI", ATTRS{serial}=="1234", SYMLINK+="ellb"
-        self.pol = PolController(port="/dev/ellb", rot1callback=self.sendRot1Position, rot2callback=self.sendRot2Position, flt1callback=self.sendFlt1Position)
-        # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
-        #SUBSYSTEM=="tty", ATTRS{manufacturer}=="THORLABS", ATTRS{serial}=="1234", SYMLINK+="kurios"
-        self.hs = Kurios(port="/dev/kurios", lctfCallback=self.sendHyperspectralStatus)
+        # Value updates are coalesced and sent in batches
+        self.values = ValAggregator(self.sendValues, window=valWindow)
+        self.values.start()
+        # Previews are processed on their own thread, the capture callback only hands over the frame
+        self.preview = PreviewWorker(self.image_send_callback, release=self.releaseFrame)
+        self.preview.start()
+        # simulatedCamera holds the SimulatedCamera options, e.g. {"width": 1224, "height": 1024}
+        if simulatedCamera is not None:
+            from components.simulatedCamera import SimulatedCamera
+            self.cam = SimulatedCamera(self.preview.submit, self.image_snapshot_callback, self.image_acquire_callback, exposureCallback=self.sendExposure, gainCallback=self.sendGain, **{"ringFrames": ringFrames, **dict(simulatedCamera)})
+            # No hardware at all, the stages and the filter are simulated as well
+            from components.simulatedDevices import SimulatedKDC, SimulatedPolController, SimulatedKurios
+            self.focus = SimulatedKDC(positionCallback=self.sendPosition)
+            self.pol = SimulatedPolController(rot1callback=self.sendRot1Position, rot2callback=self.sendRot2Position, flt1callback=self.sendFlt1Position)
+            self.hs = SimulatedKurios(lctfCallback=self.sendHyperspectralStatus)
+        else:
+            # Imported here, gxipy is only needed with the real camera
+            from components.camera import GetCamerasCamera
+            self.cam = GetCamerasCamera(self.preview.submit, self.image_snapshot_callback, self.image_acquire_callback, exposureCallback=self.sendExposure, gainCallback=self.sendGain, ringFrames=ringFrames)
+            # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
+            #SUBSYSTEM=="tty", ATTRS{manufacturer}=="Thorlabs", ATTRS{serial}=="1234", SYMLINK+="kdc1001"
+            self.focus = ThorlabsKDC(port="/dev/kdc1001", positionCallback=self.sendPosition)
+            # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
+            #SUBSYSTEM=="tty", ATTRS{manufacturer}=="FTDI", ATTRS{serial}=="1234", SYMLINK+="ellb"
+            self.pol = PolController(port="/dev/ellb", rot1callback=self.sendRot1Position, rot2callback=self.sendRot2Position, flt1callback=self.sendFlt1Position)
+            # Setting the port in /etc/udev/rules.d as (adjust serial numbers as needed!)
+            #SUBSYSTEM=="tty", ATTRS{manufacturer}=="THORLABS", ATTRS{serial}=="1234", SYMLINK+="kurios"
+            self.hs = Kurios(port="/dev/kurios", lctfCallback=self.sendHyperspectralStatus)
 
         # Root data directory
         self.pwd = '/home/user/data'
 
-    def send(self, data):
-        self.ctx.sender(json.dumps(data))
+        # Sequence numbers of the heartbeats, echoed by the clients
+        self.heartbeatSeq = itertools.count()
+        # Sequence numbers of the binary image frames
+        self.imageSeq = itertools.count()
+        # Each distinct encoding of a frame is produced only once
+        self.frameCache = FrameCache()
+        self.encodeStats = EncodeStats()
+        # Percentiles of the frame histogram mapped to black and white in the preview
+        self.previewContrast = (0.1, 99.9)
+        # Live tile updates: tile size, noise threshold (8 bit levels per pixel) and keyframe interval
+        self.tileStreams = TileStreams(tileSize=64, threshold=8, keyframeInterval=50)
+        # Snapshots are kept as pyramids, clients fetch tiles of them at any zoom level
+        self.pyramids = PyramidCache(maxEntries=4)
+        self.pyramidTileSize = 256
+        # Optionally keep the preview encoding out of this process
+        self.encoder = EncoderProcess() if encoderProcess else None
+
+    def send(self, data, topic=None):
+        # Skip serialization entirely if nobody listens
+        if not self.ctx.subscribed(topic):
+            return False
+        self.ctx.sender(json.dumps(data), topic=topic)
+        return True
     
     def stop(self):
         self.focus.stop()
         self.cam.stop()
+        self.values.stop()
+        self.preview.stop()
+        if self.encoder:
+            self.encoder.stop()
+
+    def sendValue(self, data, force=False, keep=True):
+        self.values.update(data, force, keep)
+
+    def sendValues(self, batch):
+        # One batch per module, so clients can subscribe to modules separately
+        modules = {}
+        for data in batch:
+            modules.setdefault(data["module"], []).append(data)
+        delivered = []
+        for module, values in modules.items():
+            if self.send({"type": MsgTypes.VAL.value, "data":values}, topic=Topics.val(module)):
+                delivered.extend(values)
+        return delivered
+
+    def sendCurrentValues(self, client, modules=None):
+        # Only to this client, the others already have these values
+        grouped = {}
+        for data in self.values.latest(modules):
+            grouped.setdefault(data["module"], []).append(data)
+        for module, values in grouped.items():
+            if client.subscribed(Topics.val(module)):
+                client.enqueue(json.dumps({"type": MsgTypes.VAL.value, "data":values}))
+
+    def sendStats(self, data, seq, timestamp):
+        if self.ctx.subscribed(Topics.STA):
+            self.ctx.sender(frameStats(data, seq, timestamp, self.cam.bits).pack(), droppable=True, topic=Topics.STA)
+
+    def sendImage(self, data, seq, timestamp, snapshot=False):
+        ''' Send a raw camera frame as preview to every subscribed client.
+
+        Snapshots are never dropped and do not need credits.
+        '''
+        contrast = self.previewContrast
+        if self.encoder:
+            # Only the copy into shared memory happens in this process
+            slot = self.encoder.put(data)
+            def encode(view, codec):
+                return self.encoder.encode(slot, seq, contrast, timestamp, view, codec)
+        else:
+            def encode(view, codec):
+                return encodePreviewTimed(data, seq, timestamp, view, codec, contrast)
+        def encoder(view, codec):
+            start = time.perf_counter()
+            payload, seconds = encode(view, codec)
+            self.encodeStats.record(codec[0], seconds, time.perf_counter() - start, len(payload))
+            return payload
+        def clientEncoder(client):
+            view, codec = self.previewFormat(client, data.shape)
+            if client.fullDepth:
+                # Raw values, encoded once per view and compression
+                return self.frameCache.get(seq, ("full", view), client.fullDepth,
+                                           lambda v, c: encodeFullDepth(data, seq, timestamp, view, c == Codecs.ZLIB))
+            if client.tiles:
+                return self.encodeTiles(client, data, seq, timestamp, view, codec, contrast)
+            # Clients sharing a preview format share the encoded frame
+            return self.frameCache.get(seq, view, codec, encoder)
+        self.ctx.senderEncoded(clientEncoder, droppable=not snapshot, topic=Topics.IMG, tag=seq)
+
+    def encodeTiles(self, client, data, seq, timestamp, view, codec, contrast):
+        # Rendering and the delta are computed once per view, shared by its clients
+        stream = self.tileStreams.get(view)
+        baseSeq, tiles, keyframe, img = self.frameCache.get(seq, ("tiles", view), None,
+                                                            lambda v, c: stream.update(seq, cropView(data, view), contrast))
+        if not keyframe and client.frameTag != baseSeq:
+            # The client missed the previous update, it needs the whole frame
+            tiles, keyframe = stream.allTiles(img.shape), True
+        return self.frameCache.get(seq, ("tiles", view, keyframe), codec,
+                                   lambda v, c: stream.encode(img, seq, baseSeq, timestamp, view, codec, tiles, keyframe))
+
+    def previewFormat(self, client, shape):
+        # Region and size of the client's viewport, half of the sensor by default
+        return fitView(shape, client.viewport), client.codec
+
+    def setViewport(self, client, value):
+        ''' value holds the sensor region x, y, w, h and the target width, height. '''
+        if client is None:
+            return
+        if value is None:
+            client.viewport = None
+        else:
+            client.viewport = tuple(int(value[key]) for key in ("x", "y", "w", "h", "width", "height"))
+
+    def setCodec(self, client, accepted):
+        if client is None:
+            return None
+        client.codec = negotiateCodec(accepted)
+        return [client.codec[0].name, client.codec[1]]
+
+    def setFullDepth(self, client, value):
+        ''' value is false, true or "packed", or "zlib". '''
+        if client is None:
+            return None
+        modes = {"packed": Codecs.RAW, "zlib": Codecs.ZLIB}
+        if value is True:
+            value = "packed"
+        if not value:
+            client.fullDepth = None
+        elif isinstance(value, str) and value.lower() in modes:
+            client.fullDepth = modes[value.lower()]
+        else:
+            raise ValueError(f"Unknown full depth mode {value!r}. Allowed values are false, true, {', '.join(modes)}.")
+        return client.fullDepth is not None
+
+    def sendTiles(self, client, requests):
+        ''' Send tiles of snapshot pyramids to the requesting client.
+
+        requests is one or a list of {"seq", "level", "col", "row"}.
+        '''
+        if client is None:
+            return None
+        if isinstance(requests, dict):
+            requests = [requests]
+        for request in requests:
+            pyramid = self.pyramids.get(int(request["seq"]))
+            data = pyramid.tile(int(request.get("level", 0)), int(request["col"]), int(request["row"]), client.codec, client.fullDepth)
+            # Requested explicitly, so it is queued as control data and never dropped
+            client.enqueue(data)
+        return len(requests)
+
+    def saveLastFrames(self, value):
+        ''' Dump the last frames of the camera ring, value is the number of frames
+        or {"frames", "path"} with path relative to the data directory. '''
+        if not self.cam.ring:
+            raise ValueError("No frame ring allocated")
+        if not isinstance(value, dict):
+            value = {"frames": value}
+        path = value.get("path") or os.path.join("ring", time.strftime("frames_%Y%m%d_%H%M%S.h5"))
+        if not isinstance(path, str) or os.path.isabs(path):
+            raise ValueError(f"Invalid path: {path!r}")
+        # Stay inside the data directory, also through links
+        root = os.path.realpath(self.pwd)
+        fullPath = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, fullPath]) != root or fullPath == root:
+            raise ValueError(f"Path {path!r} is outside the data directory")
+        os.makedirs(os.path.dirname(fullPath), exist_ok=True)
+        frames = self.cam.ring.save(fullPath, int(value.get("frames") or self.cam.ring.count))
+        self.sendMessage(f"Saved last {frames} frames to {path}")
+        return {"path": path, "frames": frames}
 
-    def sendImage(self, img):
-        # Convert to copressed TIFF and generate a base64 bytestring
-        buffered = io.BytesIO()
-        img.save(buffered, format='TIFF', compression='tiff_lzw')
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        # Send the image effectively
-        self.send({"type":MsgTypes.IMG.value, "data":img_str})
-    
     def sendHeartbeat(self):
-        self.send({"type":MsgTypes.HRB.value, "data":"OK"})
+        # Clients echo the data back, the server measures the round trip
+        self.send({"type":MsgTypes.HRB.value, "data":{"seq":next(self.heartbeatSeq), "t":time.monotonic()}}, topic=Topics.HRB)
     
-    def sendMessage(self, text: str):
-        self.send({"type":MsgTypes.MSG.value, "data":text})
+    def sendMessage(self, text: str, topic=None):
+        self.send({"type":MsgTypes.MSG.value, "data":text}, topic)
 
     def sendPosition(self, pos: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"focus", "field":"positionMM", "value":pos}}
-        self.send(msg)
+        self.sendValue({"module":"focus", "field":"positionMM", "value":pos})
 
     # TODO: implement this all over
     def sendExposure(self, tint: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"cam", "field":"Exposure", "value":tint}}
-        self.send(msg)
+        self.sendValue({"module":"cam", "field":"Exposure", "value":tint})
 
     # TODO: implement this all over
     def sendGain(self, gain: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"cam", "field":"Gain", "value":gain}}
-        self.send(msg)
+        self.sendValue({"module":"cam", "field":"Gain", "value":gain})
 
     def sendRot1Position(self, pos: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"polarization", "submodule":"rot1", "field":"positionDEG", "value":pos}}
-        self.send(msg)
+        self.sendValue({"module":"polarization", "submodule":"rot1", "field":"positionDEG", "value":pos})
 
     def sendRot2Position(self, pos: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"polarization", "submodule":"rot2", "field":"positionDEG", "value":pos}}
-        self.send(msg)
+        self.sendValue({"module":"polarization", "submodule":"rot2", "field":"positionDEG", "value":pos})
 
     def sendFlt1Position(self, pos: float):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"polarization", "submodule":"flt1", "field":"positionPOS", "value":pos}}
-        self.send(msg)
-
-    def sendHyperspectralStatus(self, wl: float, black: bool, status, temperature: float, min, max):
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"hyperspectral", "field":"wavelength", "value":wl}}
-        self.send(msg)
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"hyperspectral", "field":"black", "value":black}}
-        self.send(msg)
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"hyperspectral", "field":"status", "value":status}}
-        self.send(msg)
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"hyperspectral", "field":"temperature", "value":temperature}}
-        self.send(msg)
-        msg = {"type": MsgTypes.VAL.value, "data":{"module":"hyperspectral", "field":"range", "min":min, "max":max}}
-        self.send(msg)
-
-    def run_acquisition(self, data):
+        self.sendValue({"module":"polarization", "submodule":"flt1", "field":"positionPOS", "value":pos})
+
+    def sendHyperspectralStatus(self, wl: float, black: bool, status, temperature: float, min, max, force=False):
+        self.sendValue({"module":"hyperspectral", "field":"wavelength", "value":wl}, force)
+        self.sendValue({"module":"hyperspectral", "field":"black", "value":black}, force)
+        self.sendValue({"module":"hyperspectral", "field":"status", "value":status}, force)
+        self.sendValue({"module":"hyperspectral", "field":"temperature", "value":temperature}, force)
+        self.sendValue({"module":"hyperspectral", "field":"range", "min":min, "max":max}, force)
+
+    def sendServerStats(self):
+        stats = {
+            "clients": self.ctx.server.stats(),
+            "codecs": self.encodeStats.report(),
+            "cache": {"encoded": self.frameCache.encoded, "hits": self.frameCache.hits},
+            "preview": self.preview.stats(),
+            "frames": self.cam.pool.stats() if self.cam.pool else None,
+            "ring": self.cam.ring.stats() if self.cam.ring else None,
+            "registers": self.cam.registers(),
+        }
+        # Only valid when requested, not replayed to later clients
+        self.sendValue({"module":"server", "field":"stats", "value":stats}, force=True, keep=False)
+        return stats
+
+    def run_acquisition(self, data, cmd=None):
         print(f"----------Acquisition script----------")
         print(data)
         # Parse acquisition script
@@ -106,9 +292,9 @@ class System:
         print(f"--------------------------------------")
         # Create the runner
 
-        runner = AcquisitionRunner(parser, self.pwd, self)
+        runner = AcquisitionRunner(parser, self.pwd, self, progress=cmd.progress if cmd else None)
         # Notify client
-        self.send({"type":MsgTypes.MSG.value, "data":"Starting acquisition..."})
+        self.sendMessage("Starting acquisition...", Topics.ACQ)
         # Register runner to get the image
         self.cam.acquire_callback = runner.image_acquire_callback
         # Run the acquisition
@@ -116,14 +302,50 @@ class System:
         # Deregister runner callback
         self.cam.acquire_callback = self.image_acquire_callback
         # Notify client
-        self.send({"type":MsgTypes.MSG.value, "data":"Acquisition DONE!"})
+        self.sendMessage("Acquisition DONE!", Topics.ACQ)
+
+    def isSetting(self, data):
+        # Also requests that never touch the hardware, they must not wait behind an acquisition
+        command = data.get("data")
+        if data.get("type") != MsgTypes.VAL.value or not isinstance(command, dict):
+            return False
+        field = command.get("field")
+        if command.get("module") == "cam":
+            return field in self.SETTINGS or field == "Tile"
+        return command.get("module") == "server" and field == "stats"
 
-    def parseCommand(self, data):
-        ''' data should be an object, created from a valid request JSON. '''
+    def parseSetting(self, command, client):
+        ''' Apply one of SETTINGS or answer a tile or stats request, client is
+        the connection it belongs to. Returns the value sent with the completion response. '''
+        field, value = command["field"], command.get("value")
+        if command["module"] == "server":
+            # Also returned as the result of the request
+            return self.sendServerStats()
+        if field == "Tile":
+            return self.sendTiles(client, value)
+        if field == "PreviewContrast":
+            low, high = value
+            self.previewContrast = (float(low), float(high))
+        elif field == "Viewport":
+            self.setViewport(client, value)
+        elif field == "Codecs":
+            # The chosen codec is returned to the client
+            return self.setCodec(client, value)
+        elif field == "FullDepth":
+            return self.setFullDepth(client, value)
+        elif field == "Tiles":
+            if client:
+                client.tiles = bool(value)
+        return None
+
+    def parseCommand(self, data, cmd=None):
+        ''' data should be an object, created from a valid request JSON.
+        cmd is the originating Command, used for progress reporting.
+        The return value, if any, is sent with the completion response. '''
         if data["type"] == MsgTypes.MSG.value:
             print(f"MSG:", data["data"])
         elif data["type"] == MsgTypes.ACQ.value:
-            self.run_acquisition(data["data"])
+            self.run_acquisition(data["data"], cmd)
         elif data["type"] == MsgTypes.VAL.value:
             command = data["data"]
             # Here we parse the commands from the client!
@@ -133,12 +355,21 @@ class System:
                 elif command["field"] == "Gain":
                     self.cam.gain = float(command["value"])
                 elif command["field"] == "Snapshot":
-                    self.cam.triggerSnapshot()
+                    # A number averages that many frames into one snapshot
+                    value = command.get("value")
+                    average = value if isinstance(value, int) and not isinstance(value, bool) else 1
+                    self.cam.triggerSnapshot(max(1, average))
+                elif command["field"] == "SaveLast":
+                    return self.saveLastFrames(command["value"])
+                elif command["field"] == "Averaging":
+                    # {"mode": "mean" or "ema", "count": N}, null to switch off
+                    value = command["value"] or {}
+                    return self.cam.setAveraging(value.get("count", 0), value.get("mode", "mean"))
                 elif command["field"] == "Live":
                     if command["value"]:
-                        self.cam.mode = GetCamerasCamera.CameraModes.LIVE
+                        self.cam.mode = self.cam.CameraModes.LIVE
                     else:
-                        self.cam.mode = GetCamerasCamera.CameraModes.SNAPSHOT
+                        self.cam.mode = self.cam.CameraModes.SNAPSHOT
             elif command["module"] == 'focus':
                 if command["field"] == "home":
                     self.focus.home()
@@ -173,7 +404,7 @@ class System:
                         self.pol.flt1.positionPos = float(command["value"])
             elif command["module"] == 'hyperspectral':
                 if command["field"] == 'status':
-                    self.sendHyperspectralStatus(self.hs.wl, self.hs.black, f"{self.hs.status.name}", self.hs.temperature, self.hs.WLmin, self.hs.WLmax)
+                    self.sendHyperspectralStatus(self.hs.wl, self.hs.black, f"{self.hs.status.name}", self.hs.temperature, self.hs.WLmin, self.hs.WLmax, force=True)
                 if command["field"] == 'black':
                     self.hs.black = bool(command["value"])
                 if command["field"] == 'wavelength':
@@ -183,19 +414,28 @@ class System:
         else:
             print(f"Invlaid type: ", data["type"])
 
-    def image_send_callback(self, data):
-        # Convert the image to 8 bit MINMAX and produce Pillow image
-        img = data.astype(np.float32)
-        img = cv2.normalize(img, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX)
-        img = img.astype(np.uint8)
-        img = Image.fromarray(img, mode='L')
-        # Get original dimensions
-        original_width, original_height = img.size
-        # Calculate half the size and resize
-        new_width = original_width // 2
-        new_height = original_height // 2
-        img = img.resize((new_width, new_height))
-        self.sendImage(img)
+    def image_snapshot_callback(self, data):
+        # Snapshots are requested explicitly, live frames must not replace them
+        self.preview.submit(data, True, keep=True)
+
+    def image_send_callback(self, data, snapshot=False):
+        seq = next(self.imageSeq)
+        timestamp = time.time()
+        # Statistics go out for every processed frame, even when images are throttled
+        self.sendStats(data, seq, timestamp)
+        if snapshot:
+            pyramid = Pyramid(data, seq, timestamp, self.previewContrast, self.pyramidTileSize)
+            self.pyramids.add(pyramid)
+            # Levels and tile grid, clients request the tiles they show
+            self.sendValue({"module":"cam", "field":"Snapshot", "value":pyramid.info()}, force=True)
+        # Nobody watches or has credits left, skip the conversion altogether
+        if not self.ctx.subscribed(Topics.IMG, frames=not snapshot):
+            return
+        self.sendImage(data, seq, timestamp, snapshot)
+
+    def releaseFrame(self, data):
+        # Camera frames come from a pool, hand them back once processed
+        self.cam.releaseFrame(data)
 
     def image_acquire_callback(self, data):
-        pass
\ No newline at end of file
+        self.releaseFrame(data)
\ No newline at end of file
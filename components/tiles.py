@@ -0,0 +1,102 @@
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from components.frames import TileFrame
+from components.preview import CODECS, previewLUT
+
+class TileStream:
+    ''' Tile-based delta encoding of the previews of one view.
+
+    A tile is sent when at least minPixels of its pixels (by default 1% of
+    the tile) differ from the last sent version of it by more than threshold
+    levels, so small but large changes are not averaged away while single
+    noisy pixels do not resend a tile. Every keyframeInterval frames all tiles are sent. The
+    contrast table is only rebuilt on keyframes, otherwise jitter of the
+    percentiles would change every tile.
+    '''
+    def __init__(self, tileSize=64, threshold=8, keyframeInterval=50, minPixels=None):
+        self.tileSize = tileSize
+        self.threshold = threshold
+        self.minPixels = minPixels if minPixels is not None else max(1, tileSize * tileSize // 100)
+        self.keyframeInterval = keyframeInterval
+
+        self.lock = threading.Lock()
+        self.lut = None
+        self.lutDtype = None
+        self.contrast = None
+        self.reference = None
+        self.seq = None
+        self.frames = 0
+
+    def grid(self, shape):
+        ''' Start rows and columns of the tiles. '''
+        return np.arange(0, shape[0], self.tileSize), np.arange(0, shape[1], self.tileSize)
+
+    def allTiles(self, shape):
+        rows, cols = self.grid(shape)
+        return [(c, r) for r in range(len(rows)) for c in range(len(cols))]
+
+    def update(self, seq, raw, contrast=(0.1, 99.9)):
+        ''' Advance the stream to frame seq, raw cropped and decimated to the view.
+
+        Returns (baseSeq, tiles, keyframe, img) with tiles the (column, row)
+        pairs that changed since they were last sent, baseSeq the previous
+        frame and img the 8 bit preview to encode them from.
+        '''
+        with self.lock:
+            keyframe = (self.reference is None or self.reference.shape != raw.shape
+                        or self.frames % self.keyframeInterval == 0 or self.contrast != contrast
+                        or raw.dtype != self.lutDtype)
+            if keyframe:
+                self.lut = previewLUT(raw, *contrast)
+                self.lutDtype = raw.dtype
+                self.contrast = contrast
+            img = self.lut[raw]
+            if keyframe:
+                self.reference = img.copy()
+                tiles = self.allTiles(img.shape)
+            else:
+                # Pixels per tile above the noise threshold against the last sent tiles
+                rows, cols = self.grid(img.shape)
+                above = (cv2.absdiff(img, self.reference) > self.threshold).view(np.uint8)
+                counts = np.add.reduceat(np.add.reduceat(above, rows, axis=0, dtype=np.uint32), cols, axis=1)
+                changed = np.argwhere(counts >= self.minPixels)
+                tiles = [(int(c), int(r)) for r, c in changed]
+                # The client now has these tiles, they are the new reference
+                for c, r in tiles:
+                    region = self.region(c, r)
+                    self.reference[region] = img[region]
+            baseSeq = self.seq
+            self.seq = seq
+            self.frames += 1
+            return baseSeq, tiles, keyframe, img
+
+    def region(self, column, row):
+        size = self.tileSize
+        return (slice(row * size, (row + 1) * size), slice(column * size, (column + 1) * size))
+
+    def encode(self, img, seq, baseSeq, timestamp, view, codec, tiles, keyframe):
+        ''' Pack the given tiles of an 8 bit preview as a binary tile frame. '''
+        codec, param = codec
+        encoder, _ = CODECS[codec]
+        payloads = [(c, r, encoder(np.ascontiguousarray(img[self.region(c, r)]), param)) for c, r in tiles]
+        x, y, w, h, width, height = view
+        return TileFrame(seq, baseSeq, width, height, codec, timestamp, self.tileSize,
+                         payloads, keyframe, roi=(x, y, w, h)).pack()
+
+class TileStreams:
+    ''' Tile streams per view, the least recently used ones are dropped. '''
+    def __init__(self, maxStreams=8, **kwargs):
+        self.maxStreams = maxStreams
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self.streams = OrderedDict()
+
+    def get(self, view):
+        with self.lock:
+            stream = self.streams.pop(view, None) or TileStream(**self.kwargs)
+            self.streams[view] = stream
+            while len(self.streams) > self.maxStreams:
+                self.streams.popitem(last=False)
+            return stream
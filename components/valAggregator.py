@@ -0,0 +1,64 @@
+import threading
+import time
+
+class ValAggregator(threading.Thread):
+    ''' Merges VAL updates arriving within a short window into one batch.
+
+    Only the latest value per module/submodule/field is kept and values equal
+    to the last sent ones are suppressed, unless the update is forced. The
+    sender returns the values it actually delivered; only those count as sent.
+    The latest values are kept for clients that connect or subscribe later,
+    except for one-off values queued with keep=False.
+    '''
+    def __init__(self, sender, window=0.02):
+        super().__init__(daemon=True)
+        self.sender = sender
+        self.window = window
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.forced = set()
+        # Last delivered and latest known value per key
+        self.last = {}
+        self.current = {}
+        self.wakeup = threading.Event()
+        self.stopThreads = False
+
+    def stop(self):
+        self.stopThreads = True
+        self.wakeup.set()
+
+    def update(self, data, force=False, keep=True):
+        ''' Queue the data part of a VAL message. '''
+        key = (data["module"], data.get("submodule"), data["field"])
+        with self.lock:
+            self.pending[key] = data
+            if keep:
+                self.current[key] = data
+            if force:
+                self.forced.add(key)
+        self.wakeup.set()
+
+    def latest(self, modules=None):
+        ''' The latest values of modules (None for all), e.g. for a new subscriber. '''
+        with self.lock:
+            return [data for key, data in self.current.items() if modules is None or key[0] in modules]
+
+    def run(self):
+        while not self.stopThreads:
+            self.wakeup.wait()
+            # Collect everything arriving within the window
+            time.sleep(self.window)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            forced, self.forced = self.forced, set()
+            batch = [data for key, data in pending.items() if key in forced or self.last.get(key) != data]
+        if batch:
+            delivered = self.sender(batch) or ()
+            with self.lock:
+                for data in delivered:
+                    self.last[(data["module"], data.get("submodule"), data["field"])] = data
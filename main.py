@@ -7,6 +7,14 @@ from components.context import Context
 from components.handler import MsgTypes
 
 PASSWORD = "your_password"
+# Run all connections on a single asyncio event loop instead of a thread per client
+ASYNC_SERVER = False
+# Convert and encode previews in a separate process fed via shared memory
+ENCODER_PROCESS = False
+# Options of a simulated camera instead of the Daheng camera, e.g. {"width": 1224, "height": 1024, "pattern": "bars"}
+SIMULATED_CAMERA = None
+# Raw frames kept for SaveLast, each costs a full frame of memory and every frame is copied once more
+RING_FRAMES = 0
 
 def main():
     # Define context that binds function together
@@ -22,12 +30,18 @@ def main():
     ssl_context.load_cert_chain("keys/server.crt", "keys/server.key")
 
     # Create and start the server
-    server = WebSocketServer(ctx, host, port, password, handler, ssl_context)
+    if ASYNC_SERVER:
+        # Imported here, it needs websockets 13 or newer
+        from components.asyncServer import AsyncWebSocketServer
+        Server = AsyncWebSocketServer
+    else:
+        Server = WebSocketServer
+    server = Server(ctx, host, port, password, handler, ssl_context)
     server.start()
 
     # Initialize system controll
     # From here on, all things are done in the System!
-    system = System(ctx)
+    system = System(ctx, encoderProcess=ENCODER_PROCESS, simulatedCamera=SIMULATED_CAMERA, ringFrames=RING_FRAMES)
 
     try:
         # Keep sending the heartbeat!
@@ -38,6 +52,7 @@ def main():
     except KeyboardInterrupt:
         print("\nKeyboard interrupt detected. Stopping server...")
         server.stop()
+        handler.stop()
         system.stop()
 
 if __name__ == "__main__":